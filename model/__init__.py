@@ -1,56 +1,187 @@
 # -*- coding: utf-8 -*-
 import os
+import time
 
-from flask import request, session
+from flask import request, session, g
+from flask.globals import current_app
 from flask.ext.babel import gettext
-from flask.ext.login import current_user
-from werkzeug.local import LocalProxy
+from flask.ext.login import current_user, AnonymousUserMixin
 from sqlalchemy.exc import OperationalError
 
+from sipa.utils.cache import LRUCache, cache
+from sipa.utils.exceptions import DBQueryEmpty
+from .default import BaseUser
+from .division import DivisionRegistry
+from .ip_index import IPRangeIndex
 from . import sample, wu, hss, gerok
 
 
-registered_divisions = [sample.division, wu.division, hss.division, gerok.division]
+registered_divisions = DivisionRegistry([sample.division, wu.division,
+                                         hss.division, gerok.division])
+
+# (generation, user) tuples by (division name, uid), filled by the
+# flask-login user_loader
+user_cache = LRUCache()
+
+# User objects (or FOREIGN_IP) by IP, filled by user_from_ip
+ip_user_cache = LRUCache()
+
+# Cached for IPs of a division without a user
+FOREIGN_IP = object()
+
+# The divisions by the subnets they declare, built by init_context
+division_index = IPRangeIndex()
 
 
 def init_context(app):
+    user_cache.maxsize = app.config['USER_CACHE_SIZE']
+    user_cache.ttl = app.config['USER_CACHE_TTL']
+    ip_user_cache.maxsize = app.config['IP_USER_CACHE_SIZE']
+    ip_user_cache.ttl = app.config['IP_USER_CACHE_TTL']
     for division in registered_divisions:
         division.init_context(app)
+    build_division_index(app.config['DIVISION_SUBNETS'])
+
+
+def build_division_index(configured_subnets):
+    """Build the IP index of the divisions from their declared subnets
+    and the ones configured in `DIVISION_SUBNETS` for them.
+    """
+    for name, subnets in configured_subnets.iteritems():
+        division = division_from_name(name)
+        if division is None:
+            raise ValueError("DIVISION_SUBNETS: Unknown division {!r}"
+                             .format(name))
+        division.subnets.extend(subnet for subnet in subnets
+                                if subnet not in division.subnets)
+
+    division_index.build((subnet, division)
+                         for division in registered_divisions
+                         for subnet in division.subnets)
 
 
 def division_from_name(name):
-    for division in registered_divisions:
-        if division.name == name:
-            return division
-    return None
+    return registered_divisions.get(name)
+
+
+def user_from_name(division_name, uid):
+    """Return the user `uid` of the given division.
+
+    Users are served from `user_cache` if possible, so a warm cache does
+    not cause any traffic to the division's backend.  Since that cache is
+    local to the worker, a cached user is only used as long as its
+    generation in the shared cache has not been bumped by
+    `invalidate_user()` in any worker.
+    """
+    key = (division_name, uid)
+    generation = cache.get(_generation_key(division_name, uid))
+    cached = user_cache.get(key)
+    if cached is not None and cached[0] == generation:
+        return cached[1]
+
+    user = division_from_name(division_name).user_class.get(uid)
+    if isinstance(user, BaseUser):
+        user_cache.set(key, (generation, user))
+    return user
+
+
+def invalidate_user(division_name, uid):
+    """Drop a cached user in all workers, e.g. after its backend data has
+    changed.
+    """
+    user_cache.delete((division_name, uid))
+    # Entries older than the TTL are expired anyway, so the generation does
+    # not need to outlive it.
+    cache.set(_generation_key(division_name, uid), time.time(),
+              timeout=user_cache.ttl)
+
+
+def _generation_key(division_name, uid):
+    return 'user_generation:{}:{}'.format(division_name, uid)
 
 
 def division_from_ip(ip):
-    # TODO: return correct division based on IP (dummy method)
-    return sample.division
+    """Return the division whose subnets contain ip or None"""
+    return division_index.lookup(ip)
 
 
 def user_from_ip(ip):
-    return division_from_ip(ip).user_class.from_ip(ip)
+    """Return the user owning ip or an anonymous user.
+
+    Both are cached in `ip_user_cache`, so repeated requests from the
+    same IP do not cause any traffic to the division's backend.
+    """
+    division = division_from_ip(ip)
+    if division is None:
+        return AnonymousUserMixin()
+
+    user = ip_user_cache.get(ip)
+    if user is None:
+        user = division.user_class.from_ip(ip)
+        if not isinstance(user, BaseUser):
+            user = FOREIGN_IP
+        ip_user_cache.set(ip, user)
+
+    if user is FOREIGN_IP:
+        return AnonymousUserMixin()
+    return user
 
 
 def current_user_supported():
-    return LocalProxy(
-        lambda: division_from_name(
-            session['division']
-        ).user_class.supported()
-    )
+    """Return the frozen feature set of the current user's division"""
+    division = division_from_name(session.get('division'))
+    if division is None:
+        return frozenset()
+    return division.supported_features
 
 
 def query_gauge_data():
+    """Return the credit of the current user (or the one of the requesting
+    IP) as a dict with either `data` or `error` set.
+
+    The credit is memoized for the request and shared between all workers
+    for `GAUGE_CACHE_TIMEOUT` seconds, since it only changes when the
+    traffic accounting runs.
+    """
+    credit = getattr(g, '_gauge_data', None)
+    if credit is None:
+        credit = g._gauge_data = _query_gauge_data()
+    return credit
+
+
+def remember_current_credit(credit):
+    """Let query_gauge_data() use the credit of the current user queried
+    elsewhere during this request.
+    """
+    g._gauge_data = {'data': credit}
+
+
+def _query_gauge_data():
     credit = {}
+    if current_user.is_authenticated():
+        cache_key = 'gauge:{}:{}'.format(session['division'], current_user.uid)
+    else:
+        division = division_from_ip(request.remote_addr)
+        if division is None:
+            credit['error'] = gettext(u'Diese IP gehört nicht '
+                                      u'zu unserem Netzwerk')
+            return credit
+        cache_key = 'gauge:{}:{}'.format(division.name, request.remote_addr)
+
+    cached_credit = cache.get(cache_key)
+    if cached_credit is not None:
+        credit['data'] = cached_credit
+        return credit
+
     try:
         if current_user.is_authenticated():
             user = current_user
         else:
             user = user_from_ip(request.remote_addr)
         credit['data'] = user.get_current_credit()
-    except OperationalError:
+        cache.set(cache_key, credit['data'],
+                  timeout=current_app.config['GAUGE_CACHE_TIMEOUT'])
+    except (OperationalError, DBQueryEmpty):
         credit['error'] = gettext(u'Fehler bei der Abfrage der Daten')
     except AttributeError:
         credit['error'] = gettext(u'Diese IP gehört nicht '
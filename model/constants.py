@@ -2,12 +2,12 @@
 # every property displayable in the usersuite table is presented here
 from flask.ext.babel import gettext
 
-DISPLAY_FEATURE_SET = {
+DISPLAY_FEATURE_SET = frozenset({
     'user_id', 'name', 'state', 'room', 'ip', 'mac', 'mail', 'userdb'
-}
-MANIPULATE_FEATURE_SET = {
+})
+MANIPULATE_FEATURE_SET = frozenset({
     'mac_change', 'mail_change', 'userdb_change', 'password_change'
-}
+})
 
 FULL_FEATURE_SET = DISPLAY_FEATURE_SET | MANIPULATE_FEATURE_SET
 
@@ -6,6 +6,28 @@
 from model.constants import FULL_FEATURE_SET, DISPLAY_FEATURE_SET
 
 
+class lazy_field(object):
+    """Declare a user attribute which is resolved on first access.
+
+    The decorated method computes the value, which is then stored in the
+    instance's `__dict__`.  Since this descriptor does not define
+    `__set__`, the stored value shadows it on every later access.  The
+    same happens for values passed to `BaseUser.__init__`, which are
+    therefore never computed.
+    """
+
+    def __init__(self, func):
+        self.func = func
+        self.__name__ = func.__name__
+        self.__doc__ = func.__doc__
+
+    def __get__(self, obj, cls):
+        if obj is None:
+            return self
+        value = obj.__dict__[self.__name__] = self.func(obj)
+        return value
+
+
 # noinspection PyMethodMayBeStatic
 class AuthenticatedUserMixin:
     """The user object which claims to be authenticated
@@ -30,20 +52,26 @@ class BaseUser(object, AuthenticatedUserMixin):
     properly (flask special functions, used methods by sipa)
     """
 
-    def __init__(self, uid):
+    def __init__(self, uid, **fields):
         """Initialize the User object.
 
         Note that init itself is not called directly, but mainly by the
         static methods.
 
         This method should be called by any subclass.  Therefore,
-        prepend `super(User, self).__init__(uid)`.  After this, other
-        variables like `mail`, `group` or `name` can be initialized
-        similiarly.
+        prepend `super(User, self).__init__(uid, name=name, …)`.
+
+        Fields like `name`, `mail`, `group` or `ip` are declared using
+        `lazy_field` and only queried from the backend when read.  If
+        their value is already known, it can be passed as a keyword
+        argument; `None` counts as unknown.
 
         :param uid:A unique unicode identifier for the User
         """
         self.uid = uid
+        for field, value in fields.iteritems():
+            if value is not None:
+                setattr(self, field, value)
 
     def __eq__(self, other):
         return self.uid == other.uid
@@ -52,20 +80,31 @@ class BaseUser(object, AuthenticatedUserMixin):
         """Required by flask-login"""
         return self.uid
 
+    @lazy_field
+    def name(self):
+        """The real name of the user"""
+        raise NotImplementedError
+
+    @lazy_field
+    def mail(self):
+        """The mail address of the user or None"""
+        raise NotImplementedError
+
+    @lazy_field
+    def group(self):
+        """The group of the user, e.g. `active` or `passive`"""
+        raise NotImplementedError
+
     def _get_ip(self):
         """Get the IP (usually from self.uid)
 
-        This method sets self._ip accordingly.
-
-        It is used to provide the `ip` property as implemented below.
+        It is used to provide the `ip` field as implemented below.
         """
         raise NotImplementedError
 
-    @property
+    @lazy_field
     def ip(self):
-        if self._ip is None:
-            self._get_ip()
-        return self._ip
+        return self._get_ip()
 
     @staticmethod
     def get(username):
@@ -88,7 +127,7 @@ class BaseUser(object, AuthenticatedUserMixin):
         """Return a User instance or raise PasswordInvalid"""
         raise NotImplementedError
 
-    _supported_features = set()
+    _supported_features = frozenset()
 
     @classmethod
     def supported(cls):
@@ -173,10 +212,37 @@ class BaseUser(object, AuthenticatedUserMixin):
         """
         raise NotImplementedError
 
+    def get_traffic_history(self, days=30, bucket='week'):
+        """Return the traffic of the last `days` days summed up per `bucket`
+        (one of `model.traffic.BUCKETS`: 'day', 'week' or 'month') as a
+        dict.
+
+        The history uses the format of get_traffic_data(), with the
+        label of the bucket instead of the weekday and None as credit:
+
+        return {'history': [(<label>, <in>, <out>, None), …]}
+
+        Use model.traffic.build_bucketed_history() to create it.
+        """
+        raise NotImplementedError
+
     def get_current_credit(self):
         """Return the current credit in MiB"""
         raise NotImplementedError
 
+    def load_dashboard(self):
+        """Return everything shown on the usersuite page as a dict with
+        the keys `information` (see get_information()), `traffic` (see
+        get_traffic_data()) and `credit` (see get_current_credit(), None
+        if not queried).
+
+        Divisions whose backend can answer these queries concurrently
+        should override this.
+        """
+        return {'information': self.get_information(),
+                'traffic': self.get_traffic_data(),
+                'credit': None}
+
     def has_user_db(self):
         """Return whether the user activated his userdb"""
         raise NotImplementedError
@@ -5,16 +5,55 @@ def empty_function(app):
 class Division(object):
     """Division object Providing its name and the User object.
 
+    `subnets` is a list of the division's IPv4 networks in CIDR notation,
+    used to find the division of an IP.
     """
     def __init__(self, name, display_name, user_class,
                  init_context=empty_function,
-                 debug_only=False):
+                 debug_only=False, subnets=()):
         super(Division, self).__init__()
         self.name = name
         self.display_name = display_name
         self.user_class = user_class
         self._init_context = init_context
         self.debug_only = debug_only
+        self.subnets = list(subnets)
+        self.supported_features = frozenset(user_class.supported())
 
     def init_context(self, app):
         return self._init_context(app)
+
+
+class DivisionRegistry(object):
+    """The registered divisions, iterable in the order of their
+    registration and indexed by their name.
+    """
+    def __init__(self, divisions=()):
+        super(DivisionRegistry, self).__init__()
+        self._divisions = []
+        self._by_name = {}
+        for division in divisions:
+            self.register(division)
+
+    def register(self, division):
+        if division.name in self._by_name:
+            raise ValueError("Division {!r} is already registered"
+                             .format(division.name))
+        self._divisions.append(division)
+        self._by_name[division.name] = division
+        return division
+
+    def get(self, name, default=None):
+        return self._by_name.get(name, default)
+
+    def __iter__(self):
+        return iter(self._divisions)
+
+    def __len__(self):
+        return len(self._divisions)
+
+    def __contains__(self, division):
+        return self._by_name.get(getattr(division, 'name', None)) is division
+
+    def has_name(self, name):
+        return name in self._by_name
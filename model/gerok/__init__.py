@@ -2,10 +2,17 @@
 
 from flask.ext.babel import gettext
 from ..division import Division
+from api_utils import init_api
 import user
 
+
+def init_context(app):
+    init_api(app)
+
+
 division = Division(
     name='gerok',
     display_name=gettext(u"Gerokstraße"),
-    user_class=user.User
+    user_class=user.User,
+    init_context=init_context
 )
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+from collections import defaultdict
+from multiprocessing.pool import ThreadPool
+import os
+import re
+from threading import Lock
+import time
+
+from flask.globals import current_app
+from werkzeug.local import LocalProxy
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
+from sipa.utils.cache import LRUCache
+
+
+def init_api(app):
+    app.extensions['gerok_api'] = ApiClient(
+        app.config['GEROK_ENDPOINT'],
+        app.config['GEROK_API_TOKEN'],
+        connect_timeout=app.config['GEROK_CONNECT_TIMEOUT'],
+        read_timeout=app.config['GEROK_READ_TIMEOUT'],
+        retries=app.config['GEROK_RETRIES'],
+        pool_size=app.config['GEROK_POOL_SIZE'],
+        cache_size=app.config['GEROK_CACHE_SIZE'],
+        cache_ttl=app.config['GEROK_CACHE_TTL'])
+
+
+api_client = LocalProxy(lambda: current_app.extensions['gerok_api'])
+
+
+class ApiClient(object):
+    """Client for the NVTool API keeping its connections alive.
+
+    Every worker process uses its own `requests.Session`, whose pool
+    keeps up to `pool_size` connections to the endpoint open, and as
+    many threads for `call_many()`.  Failed connects are retried
+    `retries` times with a short backoff, as are reads of idempotent
+    (GET) requests and 502–504 responses.
+
+    Responses of GET requests are cached for `cache_ttl` seconds.  After
+    that, they are revalidated with a conditional request if the API
+    sent an `ETag` or `Last-Modified` header, else fetched again.  The
+    cache usage is counted per endpoint, see `cache_stats()`.
+
+    :raises requests.RequestException: if the API can not be reached
+        or does not answer in time
+    """
+
+    def __init__(self, endpoint, token, connect_timeout=3.05,
+                 read_timeout=10, retries=2, backoff_factor=0.1,
+                 pool_size=10, verify=False, cache_size=1024, cache_ttl=60):
+        self.endpoint = endpoint
+        self.headers = {'Authorization': 'Token token=' + token}
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.pool_size = pool_size
+        self.verify = verify
+        self.cache_ttl = cache_ttl
+        # (fetched at, ETag, Last-Modified, data) by request
+        self.response_cache = LRUCache(maxsize=cache_size)
+        self._counters = defaultdict(lambda: {'fresh': 0, 'revalidated': 0,
+                                              'fetched': 0})
+        self._session = None
+        self._pool = None
+        self._pid = None
+        self._lock = Lock()
+
+    def _check_pid(self):
+        """Create the session and thread pool of the current process.
+
+        They are not shared with forked workers, since their pooled
+        sockets would be used concurrently.  Must be called with the
+        lock held.
+        """
+        if self._pid != os.getpid():
+            self._session = self._create_session()
+            self._pool = None
+            self._pid = os.getpid()
+
+    @property
+    def session(self):
+        """The session of the current process"""
+        with self._lock:
+            self._check_pid()
+            return self._session
+
+    @property
+    def pool(self):
+        """The thread pool of the current process used by `call_many()`"""
+        with self._lock:
+            self._check_pid()
+            if self._pool is None:
+                self._pool = ThreadPool(self.pool_size)
+            return self._pool
+
+    def _create_session(self):
+        session = requests.Session()
+        session.headers.update(self.headers)
+        session.verify = self.verify
+
+        retry = Retry(total=self.retries, backoff_factor=self.backoff_factor,
+                      status_forcelist=(502, 503, 504))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size,
+                              max_retries=retry)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def call(self, request, method='get', postdata=None):
+        """Request `request` relative to the endpoint and return the decoded
+        JSON response.
+        """
+        url = self.endpoint + request
+        if method != 'get':
+            return self.session.post(url, data=postdata,
+                                     timeout=self.timeout).json()
+
+        cached = self.response_cache.get(request)
+        if cached is not None and time.time() - cached[0] < self.cache_ttl:
+            self._count(request, 'fresh')
+            return cached[3]
+
+        headers = {}
+        if cached is not None:
+            if cached[1]:
+                headers['If-None-Match'] = cached[1]
+            if cached[2]:
+                headers['If-Modified-Since'] = cached[2]
+
+        response = self.session.get(url, headers=headers,
+                                    timeout=self.timeout)
+
+        if response.status_code == 304 and cached is not None:
+            self._count(request, 'revalidated')
+            data = cached[3]
+        else:
+            self._count(request, 'fetched')
+            data = response.json()
+            if response.status_code != 200:
+                return data
+
+        self.response_cache.set(request, (
+            time.time(),
+            response.headers.get('ETag', cached and cached[1]),
+            response.headers.get('Last-Modified', cached and cached[2]),
+            data,
+        ))
+        return data
+
+    def call_many(self, request_list):
+        """Issue several GET requests concurrently and return their decoded
+        responses in the same order.
+
+        The worker threads only use this object, so no app context is
+        needed.
+        """
+        return self.pool.map(self.call, request_list)
+
+    @staticmethod
+    def endpoint_name(request):
+        """Return the request with ids and query values removed, e.g.
+        `:id/traffic` for `42/traffic` or `find?login` for `find?login=x`
+        """
+        path, _, query = request.partition('?')
+        name = re.sub(r'(^|/)\d+(?=/|$)', r'\1:id', path)
+        if query:
+            name += '?' + '&'.join(sorted(param.partition('=')[0]
+                                          for param in query.split('&')))
+        return name
+
+    def _count(self, request, kind):
+        with self._lock:
+            self._counters[self.endpoint_name(request)][kind] += 1
+
+    def cache_stats(self):
+        """Return the cache usage by endpoint.
+
+        `fresh` responses were served without a request, `revalidated`
+        ones after a 304 response and `fetched` ones were downloaded.
+        """
+        with self._lock:
+            stats = {name: dict(counters)
+                     for name, counters in self._counters.iteritems()}
+        for counters in stats.itervalues():
+            total = sum(counters.values())
+            counters['hit_rate'] = (float(counters['fresh'] +
+                                          counters['revalidated']) / total
+                                    if total else 0.0)
+        return stats
@@ -2,14 +2,15 @@
 import datetime
 
 from flask.ext.login import AnonymousUserMixin
-from flask.globals import current_app
 
 from model.constants import FULL_FEATURE_SET, info_property, ACTIONS, \
-    STATUS_COLORS, WEEKDAYS
+    STATUS_COLORS
 from model.default import BaseUser
+from model.gerok.api_utils import api_client
+from model.traffic import build_traffic_history, build_bucketed_history, \
+    sum_by_bucket
 from sipa.utils.exceptions import PasswordInvalid, UserNotFound
 
-import requests
 
 # noinspection PyMethodMayBeStatic
 class User(BaseUser):
@@ -20,16 +21,13 @@ class User(BaseUser):
     """
 
     def __init__(self, uid, id, name=None, mail=None, ip=None):
-        super(User, self).__init__(uid)
+        super(User, self).__init__(uid, name=name, mail=mail, ip=ip)
         self.id = id
-        self.name = name
         self.group = "static group"
-        self.mail = mail
-        self._ip = ip
 
     def _get_ip(self):
         # TODO: check whether / how this function is used.
-        self._ip = "127.0.0.1"
+        return "127.0.0.1"
 
     def __repr__(self):
         return "User<{},{}.{}>".format(self.uid, self.name, self.group)
@@ -77,8 +75,28 @@ class User(BaseUser):
             return AnonymousUserMixin()
 
     def get_information(self):
-        userData = User.do_api_call(str(self.id))
+        return self._information_from(User.do_api_call(str(self.id)))
 
+    def get_traffic_data(self):
+        return self._traffic_from(User.do_api_call(str(self.id) + '/traffic'))
+
+    def get_current_credit(self):
+        return self._credit_from(User.do_api_call(str(self.id) + '/credit'))
+
+    def load_dashboard(self):
+        """Query the information, traffic and credit concurrently"""
+        userData, trafficData, creditData = api_client.call_many([
+            str(self.id),
+            str(self.id) + '/traffic',
+            str(self.id) + '/credit',
+        ])
+
+        return {'information': self._information_from(userData),
+                'traffic': self._traffic_from(trafficData),
+                'credit': self._credit_from(creditData)}
+
+    @staticmethod
+    def _information_from(userData):
         return {
             'id': info_property(userData["id"]),
             'uid': info_property(userData["login"]),
@@ -91,40 +109,47 @@ class User(BaseUser):
             'hostalias': info_property(", ".join([h["alias"] for h in userData["hosts"] if h["alias"] != None]))
         }
 
-    def get_traffic_data(self):
+    @staticmethod
+    def _traffic_from(trafficData):
+        if not trafficData:
+            return {'credit': 0,
+                    'history': build_traffic_history({}, datetime.date.today())}
+
+        hostOneTraffic = trafficData[0]["traffic"]
+        traffic_by_date = {
+            datetime.datetime.strptime(x['date'], "%Y-%m-%d").date():
+                (x['in'], x['out'], x['credit'])
+            for x in hostOneTraffic
+        }
+
+        return {
+            'history': build_traffic_history(traffic_by_date,
+                                             datetime.date.today(),
+                                             divisor=1048576.0),
+            'credit': hostOneTraffic[-1]['credit'] / 1048576,
+        }
+
+    def get_traffic_history(self, days=30, bucket='week'):
+        """Sum up the daily traffic returned by the API per bucket.
+
+        Days the API does not return anymore are counted as zero.
+        """
         trafficData = User.do_api_call(str(self.id) + '/traffic')
 
-        if (trafficData):
-            hostOneTraffic = trafficData[0]["traffic"]
-            traffic = {'history': [], 'credit': 0}
-
-            # loop through expected days ([-6..0])
-            for d in range(-6, 1):
-                date = datetime.date.today() + datetime.timedelta(d)
-                day = date.strftime('%w')
-                # pick the to `date` corresponding data
-                d = next((x for x in hostOneTraffic if x['date'] == date.strftime("%Y-%m-%d")), None)
-                if d:
-                    (input, output, credit) = (
-                        round(d[param] / 1048576.0, 2)
-                        for param in ['in', 'out', 'credit']
-                    )
-                    traffic['history'].append(
-                        (WEEKDAYS[day], input, output, credit))
-                else:
-                    traffic['history'].append(
-                        (WEEKDAYS[day], 0.0, 0.0, 0.0))
-
-            traffic['credit'] = (lambda x: x['credit']/1048576)(hostOneTraffic[-1])
-
-            return traffic
-        else:
-            return {'credit': 0,
-                'history': [(WEEKDAYS[str(day)], 0, 0, 0)
-                            for day in range(7)]}
+        traffic_by_date = {}
+        if trafficData:
+            traffic_by_date = {
+                datetime.datetime.strptime(x['date'], "%Y-%m-%d").date():
+                    (x['in'], x['out'])
+                for x in trafficData[0]["traffic"]
+            }
 
-    def get_current_credit(self):
-        creditData = User.do_api_call(str(self.id) + '/credit')
+        return {'history': build_bucketed_history(
+            sum_by_bucket(traffic_by_date, bucket), datetime.date.today(),
+            days, bucket, divisor=1048576.0)}
+
+    @staticmethod
+    def _credit_from(creditData):
         return creditData[0]["credit"]/1048576 if creditData else 0
 
     def change_password(self, old, new):
@@ -140,12 +165,4 @@ class User(BaseUser):
     def do_api_call(request, method = 'get', postdata = None):
         """Request the NVTool-Api for informations
         """
-        requestUri = current_app.config['GEROK_ENDPOINT'] + request
-        authHeaderStr = 'Token token=' + current_app.config['GEROK_API_TOKEN']
-
-        if (method == 'get'):
-            response = requests.get(requestUri, verify=False, headers={'Authorization': authHeaderStr})
-        else:
-            response = requests.post(requestUri, data = postdata, verify=False, headers={'Authorization': authHeaderStr})
-
-        return response.json()
+        return api_client.call(request, method, postdata)
@@ -3,14 +3,15 @@
 
 import datetime
 
-from sqlalchemy import create_engine
 from flask.ext.babel import gettext
 from flask.globals import current_app
 from sqlalchemy.exc import OperationalError
 
 from werkzeug.local import LocalProxy
 
-from model.constants import WEEKDAYS
+from model.sql_utils import create_db_engine, execute_query
+from model.traffic import build_traffic_history, build_bucketed_history, \
+    history_start, date_from_bucket_key, TIMETAG_BUCKET_SQL
 from sipa import logger
 from sipa.utils import timetag_from_timestamp, timestamp_from_timetag
 from sipa.utils.exceptions import DBQueryEmpty
@@ -18,12 +19,12 @@ from .ldap_utils import get_current_uid
 
 
 def init_db(app):
-    app.extensions['db_hss'] = create_engine(
+    app.extensions['db_hss'] = create_db_engine(
         'mysql+mysqldb://{0}:{1}@{2}:3306/netusers'.format(
             app.config['DB_ATLANTIS_USER'],
             app.config['DB_ATLANTIS_PASSWORD'],
             app.config['DB_ATLANTIS_HOST']),
-        echo=False, connect_args={'connect_timeout': app.config['SQL_TIMEOUT']}
+        app.config
     )
 
 
@@ -35,11 +36,10 @@ DORMITORIES = dict(HSS46=u'Hochschulstr. 46', HSS48=u'Hochschulstr. 48')
 def sql_query(query, args=(), database=db_hss):
     """Prepare and execute a raw sql query.
     'args' is a tuple needed for string replacement.
+
+    The rows are fetched before the connection is given back to the pool.
     """
-    conn = database.connect()
-    result = conn.execute(query, args)
-    conn.close()
-    return result
+    return execute_query(database, query, args)
 
 
 def status_string_from_flags(disabled, category, description, disable_date):
@@ -95,54 +95,69 @@ def user_id_from_ip(ip):
 
 def query_current_credit(uid=None, ip=None):
     """Returns the current credit in MiB
+
+    The user, its computer, today's traffic and today's credit are
+    joined in a single query.  If `uid` is given, `ip` is ignored.
+
     :param uid: The id of the user
     :param ip: The ip of the user
     :return: The current amount of credit or False if foreign IP
     """
-    if uid is None:
-        if ip is None:
-            raise AttributeError('Either ip or user_id must be specified!')
-        user_id = user_id_from_ip(ip)
-        if user_id is 0:
-            return False  # IP doesn't correspond to any user
+    if uid is not None:
+        condition = "n.unix_account = %(uid)s"
+    elif ip is not None:
+        condition = "comp.c_ip = %(ip)s"
     else:
-        user_id = user_id_from_uid(uid)
-        ip = ip_from_user_id(user_id)
+        raise AttributeError('Either ip or user_id must be specified!')
 
     try:
         result = sql_query(
-            "SELECT amount - input - output as current "
-            "FROM traffic.tuext AS t "
-            "LEFT OUTER JOIN credit AS c ON t.timetag = c.timetag "
-            "WHERE ip = %(ip)s AND c.user_id = %(user_id)s "
-            "AND t.timetag = %(today)s",
-            {'today': timetag_from_timestamp(), 'ip': ip, 'user_id': user_id}
+            "SELECT c.amount - t.input - t.output AS current "
+            "FROM computer AS comp "
+            "JOIN nutzer AS n ON n.nutzer_id = comp.nutzer_id "
+            "LEFT OUTER JOIN traffic.tuext AS t "
+            "ON t.ip = comp.c_ip AND t.timetag = %(today)s "
+            "LEFT OUTER JOIN credit AS c "
+            "ON c.user_id = comp.nutzer_id AND c.timetag = t.timetag "
+            "WHERE " + condition + " "
+            "LIMIT 1",
+            {'today': timetag_from_timestamp(), 'ip': ip, 'uid': uid}
         ).fetchone()
     except OperationalError as e:
         logger.critical('Unable to connect to MySQL server',
                         extra={'data': {'exception_args': e.args}})
         raise
-    else:
-        return round(result['current'] / 1024, 2)
 
+    if result is None:
+        if uid is None:
+            return False  # IP doesn't correspond to any user
+        raise DBQueryEmpty('Nutzer hat keine IP')
+    if result['current'] is None:
+        raise DBQueryEmpty('No credit retrieved for user {}'
+                           .format(uid or ip))
+
+    return round(result['current'] / 1024, 2)
 
-def query_trafficdata(ip, user_id):
+
+def query_trafficdata(ip, user_id, days=7):
     """Query traffic input/output for IP
 
     :param ip: a valid ip
     :param user_id: an id of a mysql user tuple
+    :param days: the number of days up to today to query
     :return: a dict containing the traffic data in the form of
     {'history': [('weekday', in, out, credit), …], 'credit': credit}
     """
+    today = timetag_from_timestamp()
     trafficdata = sql_query(
         "SELECT t.timetag - %(today)s AS day, input, output, amount "
         "FROM traffic.tuext AS t "
         "LEFT OUTER JOIN credit AS c ON t.timetag = c.timetag "
         "WHERE ip = %(ip)s AND c.user_id = %(uid)s "
-        "AND t.timetag BETWEEN %(weekago)s AND %(today)s "
+        "AND t.timetag BETWEEN %(first)s AND %(today)s "
         "ORDER BY 'day' DESC ",
-        {'today': timetag_from_timestamp(),
-         'weekago': timetag_from_timestamp() - 6,
+        {'today': today,
+         'first': today - (days - 1),
          'ip': ip,
          'uid': user_id}
     ).fetchall()
@@ -151,31 +166,67 @@ def query_trafficdata(ip, user_id):
         raise DBQueryEmpty('No trafficdata retrieved for user {}@{}'
                            .format(user_id, ip))
 
-    traffic = {'history': [], 'credit': 0}
-    returned_days = [int(i['day']) for i in trafficdata]
-
-    # loop through expected days ([-6..0])
-    for d in range(-6, 1):
-        day = datetime.date.fromtimestamp(
-            timestamp_from_timetag(timetag_from_timestamp() + d)
-        ).strftime('%w')
-        if d in returned_days:
-            # pick the to `d` corresponding item of the mysql-result
-            i = next((x for x in trafficdata if x['day'] == d), None)
-
-            (input, output, credit) = (
-                round(i[param] / 1024.0, 2)
-                for param in ['input', 'output', 'amount']
-            )
-            traffic['history'].append(
-                (WEEKDAYS[day], input, output, credit))
-        else:
-            traffic['history'].append(
-                (WEEKDAYS[day], 0.0, 0.0, 0.0))
+    today_date = datetime.date.fromtimestamp(timestamp_from_timetag(today))
+    traffic_by_date = {
+        today_date + datetime.timedelta(days=int(row['day'])):
+            (row['input'], row['output'], row['amount'])
+        for row in trafficdata
+    }
+
+    history = build_traffic_history(traffic_by_date, today_date, days=days,
+                                    divisor=1024.0)
+    _, input, output, credit = history[-1]
+
+    return {'history': history, 'credit': credit - input - output}
+
+
+def query_traffic_history(ip, user_id, days=30, bucket='week'):
+    """Query the traffic of the last `days` days summed up per bucket
+    (see `model.traffic.BUCKETS`).
+
+    The database does the summing up, so at most one row per bucket is
+    transferred.  The rows of `traffic.tuext` are selected by `ip` and a
+    range of `timetag`, so a covering index like
+
+        CREATE INDEX ip_timetag_io ON traffic.tuext
+            (ip, timetag, input, output);
+
+    answers the query from the index alone, together with one on
+    `credit (user_id, timetag)` for the join.
+
+    :param ip: a valid ip
+    :param user_id: an id of a mysql user tuple
+    :return: a dict containing the traffic history in the form of
+    {'history': [('label', in, out, None), …]}
+    """
+    if bucket not in TIMETAG_BUCKET_SQL:
+        raise ValueError("Unknown bucket {!r}".format(bucket))
+
+    today = timetag_from_timestamp()
+    today_date = datetime.date.fromtimestamp(timestamp_from_timetag(today))
+    first = today - (today_date - history_start(today_date, days, bucket)).days
+
+    rows = sql_query(
+        "SELECT {} AS bucket, SUM(input) AS input, SUM(output) AS output "
+        "FROM traffic.tuext AS t "
+        "JOIN credit AS c ON t.timetag = c.timetag "
+        "WHERE t.ip = %(ip)s AND c.user_id = %(uid)s "
+        "AND t.timetag BETWEEN %(first)s AND %(today)s "
+        "GROUP BY bucket".format(TIMETAG_BUCKET_SQL[bucket]),
+        {'today': today,
+         'first': first,
+         'ip': ip,
+         'uid': user_id}
+    ).fetchall()
 
-    traffic['credit'] = (lambda x: x[3] - x[1] - x[2])(traffic['history'][-1])
+    traffic_by_bucket = {
+        date_from_bucket_key(row['bucket'], bucket):
+            (row['input'] or 0, row['output'] or 0)
+        for row in rows
+    }
 
-    return traffic
+    return {'history': build_bucketed_history(traffic_by_bucket, today_date,
+                                              days, bucket, divisor=1024.0)}
 
 
 def update_macaddress(ip, oldmac, newmac):
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+from bisect import bisect_right
+import socket
+import struct
+
+
+def ip_to_int(ip):
+    """Convert a dotted IPv4 address to an integer.
+
+    :raises ValueError: if ip is not a valid IPv4 address
+    """
+    try:
+        return struct.unpack('!I', socket.inet_aton(ip))[0]
+    except (socket.error, TypeError):
+        raise ValueError("Invalid IPv4 address {!r}".format(ip))
+
+
+def network_range(network):
+    """Return the first and the last address of a network in CIDR
+    notation (e.g. `'141.30.228.0/24'`) as integers.
+
+    :raises ValueError: if network is not a valid IPv4 network
+    """
+    address, _, prefix = network.partition('/')
+    try:
+        prefix = int(prefix) if prefix else 32
+    except ValueError:
+        raise ValueError("Invalid network {!r}".format(network))
+    if not 0 <= prefix <= 32:
+        raise ValueError("Invalid network {!r}".format(network))
+
+    mask = (0xffffffff << (32 - prefix)) & 0xffffffff
+    start = ip_to_int(address) & mask
+    return start, start | (~mask & 0xffffffff)
+
+
+class IPRangeIndex(object):
+    """Maps IPv4 addresses to values by the networks they are in.
+
+    The networks are kept as sorted, non-overlapping intervals, so a
+    lookup is a binary search over their start addresses.
+    """
+
+    def __init__(self):
+        self._starts = []
+        self._ranges = []
+
+    def __len__(self):
+        return len(self._ranges)
+
+    def build(self, networks):
+        """Replace the index by the given `(network, value)` pairs.
+
+        :raises ValueError: if a network is invalid or overlaps with
+            another one
+        """
+        ranges = sorted((network_range(network) + (value,)
+                         for network, value in networks),
+                        key=lambda r: r[:2])
+        for previous, current in zip(ranges, ranges[1:]):
+            if current[0] <= previous[1]:
+                raise ValueError("Overlapping networks in the IP index")
+
+        self._ranges = ranges
+        self._starts = [start for start, _, _ in ranges]
+
+    def lookup(self, ip, default=None):
+        """Return the value of the network containing ip or default"""
+        try:
+            address = ip_to_int(ip)
+        except ValueError:
+            return default
+        i = bisect_right(self._starts, address) - 1
+        if i >= 0 and address <= self._ranges[i][1]:
+            return self._ranges[i][2]
+        return default
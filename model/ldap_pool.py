@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+from contextlib import contextmanager
+from threading import Lock
+import os
+import time
+
+import ldap
+from ldap.filter import escape_filter_chars
+
+
+class LdapConnectionPool(object):
+    """A thread safe pool of anonymously bound LDAP connections.
+
+    Connections are opened lazily and at most `size` idle connections
+    are kept.  If the pool is empty, a new connection is opened; if it
+    is full, released connections are unbound instead of being kept.
+
+    Connections which were idle for longer than `check_interval`
+    seconds are checked with a `whoami_s()` before being handed out.
+    Connections raising `SERVER_DOWN` are discarded.
+
+    The pool remembers the pid it was filled in, so a forked (uwsgi)
+    worker never reuses the sockets of its parent.
+
+    :param uri: The LDAP uri, e.g. `ldap://127.0.0.1:389`
+    :param size: The maximum number of idle connections
+    :param check_interval: Idle seconds after which a connection is checked
+    """
+
+    def __init__(self, uri, size=4, check_interval=30):
+        self.uri = uri
+        self.size = size
+        self.check_interval = check_interval
+        self._idle = []
+        self._pid = os.getpid()
+        self._lock = Lock()
+
+    def _connect(self):
+        l = ldap.initialize(self.uri)
+        l.protocol_version = ldap.VERSION3
+        l.simple_bind_s('', '')
+        return l
+
+    @staticmethod
+    def _close(l):
+        try:
+            l.unbind_s()
+        except ldap.LDAPError:
+            pass
+
+    def _is_alive(self, l):
+        try:
+            l.whoami_s()
+        except ldap.LDAPError:
+            return False
+        return True
+
+    def clear(self):
+        """Close all idle connections"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for l, _ in idle:
+            self._close(l)
+
+    def acquire(self):
+        """Take an anonymously bound connection out of the pool"""
+        while True:
+            with self._lock:
+                if self._pid != os.getpid():
+                    # inherited from the parent process, do not unbind
+                    self._idle = []
+                    self._pid = os.getpid()
+                if not self._idle:
+                    break
+                l, released_at = self._idle.pop()
+            if (time.time() - released_at < self.check_interval
+                    or self._is_alive(l)):
+                return l
+            self._close(l)
+        return self._connect()
+
+    def release(self, l, rebind=False, discard=False):
+        """Give a connection back to the pool.
+
+        :param rebind: Whether the connection was bound as a user and
+            has to be bound anonymously again
+        :param discard: Whether to close the connection instead
+        """
+        if not discard and rebind:
+            try:
+                l.simple_bind_s('', '')
+            except ldap.LDAPError:
+                discard = True
+
+        with self._lock:
+            if (not discard and self._pid == os.getpid()
+                    and len(self._idle) < self.size):
+                self._idle.append((l, time.time()))
+                return
+        self._close(l)
+
+    @contextmanager
+    def connection(self):
+        """Context manager providing a pooled connection.
+
+        A connection raising `SERVER_DOWN` is not given back to the pool.
+        """
+        l = self.acquire()
+        server_down = False
+        try:
+            yield l
+        except ldap.SERVER_DOWN:
+            server_down = True
+            raise
+        finally:
+            self.release(l, discard=server_down)
+            if server_down:
+                # the other idle connections are most likely dead, too
+                self.clear()
+
+    def search_s(self, *args, **kwargs):
+        """`search_s` on a pooled connection.
+
+        If the server went away in the meantime, the search is retried
+        once on a fresh connection.
+        """
+        try:
+            with self.connection() as l:
+                return l.search_s(*args, **kwargs)
+        except ldap.SERVER_DOWN:
+            with self.connection() as l:
+                return l.search_s(*args, **kwargs)
+
+
+class LdapGroupIndex(object):
+    """An in-memory index of the members of some LDAP groups.
+
+    All groups are fetched with a single search, which is repeated
+    once the index is older than `ttl` seconds.
+
+    :param pool: The `LdapConnectionPool` to search with
+    :param base: The search base of the groups
+    :param groups: The common names of the indexed groups
+    :param ttl: The number of seconds after which the index is refreshed
+    """
+
+    def __init__(self, pool, base, groups, ttl):
+        self.pool = pool
+        self.base = base
+        self.groups = tuple(groups)
+        self.ttl = ttl
+        self._members = {}
+        self._refreshed_at = None
+        self._lock = Lock()
+
+    def refresh(self):
+        with self._lock:
+            self._refresh()
+
+    def _refresh(self):
+        """Fetch the groups.  Must be called with the lock held."""
+        result = self.pool.search_s(
+            self.base, ldap.SCOPE_SUBTREE,
+            '(|{})'.format(''.join('(cn={})'.format(escape_filter_chars(g))
+                                   for g in self.groups)),
+            ['cn', 'memberUid'])
+
+        members = {}
+        for _, attrs in result:
+            for group in attrs.get('cn', []):
+                for uid in attrs.get('memberUid', []):
+                    members.setdefault(uid, set()).add(group)
+
+        self._members = members
+        self._refreshed_at = time.time()
+
+    def _expired(self):
+        return (self._refreshed_at is None
+                or time.time() - self._refreshed_at > self.ttl)
+
+    def groups_of(self, uid):
+        """Return the set of indexed groups the given uid is member of.
+
+        An expired index is refreshed by one thread while the others
+        keep using the old one.  Only if there is none yet, they wait
+        for it.
+        """
+        if self._expired():
+            blocking = self._refreshed_at is None
+            if self._lock.acquire(blocking):
+                try:
+                    # another thread might have refreshed it meanwhile
+                    if self._expired():
+                        self._refresh()
+                finally:
+                    self._lock.release()
+        return self._members.get(uid, set())
@@ -1,11 +1,13 @@
 # -*- coding: utf-8 -*-
+import datetime
 from random import random
 
 from flask.ext.login import AnonymousUserMixin
 
 from model.constants import FULL_FEATURE_SET, info_property, ACTIONS, \
     STATUS_COLORS, WEEKDAYS
-from model.default import BaseUser
+from model.default import BaseUser, lazy_field
+from model.traffic import build_bucketed_history, sum_by_bucket
 from sipa.utils.exceptions import PasswordInvalid, UserNotFound
 
 import ConfigParser
@@ -41,17 +43,26 @@ class User(BaseUser):
     the terms 'uid' and 'username' refer to the same thing.
     """
 
-    def __init__(self, uid, name=None, mail=None, ip=None):
-        super(User, self).__init__(uid)
-        self.config = self._get_config()
-        self.name = self.config.get(uid, 'name')
+    def __init__(self, uid, name=None, mail=None, ip=None, config=None):
+        super(User, self).__init__(uid, name=name, mail=mail, ip=ip,
+                                   config=config)
         self.group = "static group"
-        self.mail = self.config.get(uid, 'mail')
-        self._ip = ip
+
+    @lazy_field
+    def config(self):
+        return self._get_config()
+
+    @lazy_field
+    def name(self):
+        return self.config.get(self.uid, 'name')
+
+    @lazy_field
+    def mail(self):
+        return self.config.get(self.uid, 'mail')
 
     def _get_ip(self):
         # TODO: check whether / how this function is used.
-        self._ip = "127.0.0.1"
+        return "127.0.0.1"
 
     @staticmethod
     def _get_config():
@@ -81,7 +92,7 @@ class User(BaseUser):
         """
         config = User._get_config()
         if config.has_section(username):
-            return User(username)
+            return User(username, config=config)
         else:
             return AnonymousUserMixin()
 
@@ -136,6 +147,14 @@ class User(BaseUser):
                 'history': [(WEEKDAYS[str(day)], rand(), rand()*0.1, rand())
                             for day in range(7)]}
 
+    def get_traffic_history(self, days=30, bucket='week'):
+        today = datetime.date.today()
+        traffic_by_date = {today - datetime.timedelta(days=d):
+                           (random() * 1024, random() * 102.4)
+                           for d in range(days)}
+        return {'history': build_bucketed_history(
+            sum_by_bucket(traffic_by_date, bucket), today, days, bucket)}
+
     def get_current_credit(self):
         return round(random() * 1024 * 63, 2)
 
@@ -146,3 +165,4 @@ class User(BaseUser):
     def change_mail(self, password, new_mail):
         self.config.set(self.uid, 'mail', new_mail)
         self._write_config()
+        self.mail = new_mail
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+from threading import Lock
+import time
+
+from sqlalchemy import create_engine, event, exc
+
+
+class PoolStats(object):
+    """Counters describing the usage of an engine's connection pool"""
+
+    def __init__(self):
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.disconnects = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+        self._lock = Lock()
+
+    def increment(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def record_wait(self, seconds):
+        with self._lock:
+            self.wait_time += seconds
+            self.max_wait_time = max(self.max_wait_time, seconds)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'connects': self.connects,
+                'checkouts': self.checkouts,
+                'checkins': self.checkins,
+                'disconnects': self.disconnects,
+                'wait_time': self.wait_time,
+                'max_wait_time': self.max_wait_time,
+            }
+
+
+def create_db_engine(url, config):
+    """Create an engine with the pool settings given in the app config.
+
+    * `SQL_POOL_SIZE`, `SQL_POOL_MAX_OVERFLOW`, `SQL_POOL_TIMEOUT` and
+      `SQL_POOL_RECYCLE` are passed to the QueuePool.
+    * If `SQL_POOL_PRE_PING` is set, connections are tested with a
+      `SELECT 1` on checkout and silently replaced if the server closed
+      them (e.g. after its `wait_timeout`).
+    * If `SQL_STATEMENT_TIMEOUT` is set, it limits the execution time of
+      every statement (`max_execution_time`, MySQL ≥ 5.7.8).
+
+    The pool statistics are available as `engine.pool_stats`.
+    """
+    engine = create_engine(
+        url, echo=False,
+        pool_size=config['SQL_POOL_SIZE'],
+        max_overflow=config['SQL_POOL_MAX_OVERFLOW'],
+        pool_timeout=config['SQL_POOL_TIMEOUT'],
+        pool_recycle=config['SQL_POOL_RECYCLE'],
+        connect_args={'connect_timeout': config['SQL_TIMEOUT']}
+    )
+    stats = engine.pool_stats = PoolStats()
+    pre_ping = config['SQL_POOL_PRE_PING']
+    statement_timeout = config['SQL_STATEMENT_TIMEOUT']
+
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        stats.increment('connects')
+        if statement_timeout:
+            cursor = dbapi_connection.cursor()
+            cursor.execute("SET SESSION max_execution_time = %d"
+                           % (statement_timeout * 1000))
+            cursor.close()
+
+    @event.listens_for(engine, 'checkout')
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        stats.increment('checkouts')
+        if not pre_ping:
+            return
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute("SELECT 1")
+        except Exception:
+            stats.increment('disconnects')
+            # makes the pool retry with a new connection
+            raise exc.DisconnectionError()
+        finally:
+            cursor.close()
+
+    @event.listens_for(engine, 'checkin')
+    def on_checkin(dbapi_connection, connection_record):
+        stats.increment('checkins')
+
+    return engine
+
+
+class QueryResult(object):
+    """The rows of a query result, fetched before the connection was given
+    back to the pool.
+
+    Provides the parts of sqlalchemy's `ResultProxy` used by sipa.
+    """
+
+    def __init__(self, result):
+        self.rowcount = result.rowcount
+        self.rows = result.fetchall() if result.returns_rows else []
+        self._position = 0
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def fetchone(self):
+        if self._position >= len(self.rows):
+            return None
+        row = self.rows[self._position]
+        self._position += 1
+        return row
+
+    def fetchall(self):
+        rows = self.rows[self._position:]
+        self._position = len(self.rows)
+        return rows
+
+
+def execute_query(database, query, args=()):
+    """Execute a raw sql query and return its materialized result.
+
+    The connection is given back to the pool before this function
+    returns.
+    """
+    start = time.time()
+    conn = database.connect()
+    database.pool_stats.record_wait(time.time() - start)
+    try:
+        return QueryResult(conn.execute(query, args))
+    finally:
+        conn.close()
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+from datetime import date, timedelta
+
+from model.constants import WEEKDAYS
+from sipa.utils import timestamp_from_timetag
+
+
+def build_traffic_history(traffic_by_date, today, days=7, divisor=1.0):
+    """Return the traffic history of the `days` days up to `today`.
+
+    :param traffic_by_date: A dict mapping a date to the tuple
+        `(input, output, credit)` of that day.  Days missing in it are
+        filled with zeros.
+    :param today: The date of the last day of the history
+    :param days: The length of the history
+    :param divisor: The values are divided by it (e.g. to get MiB) and
+        rounded to two digits
+    :return: A list of `(weekday, input, output, credit)` tuples, oldest
+        first, as used in the `history` of `get_traffic_data()`
+    """
+    history = []
+    for offset in range(days - 1, -1, -1):
+        day = today - timedelta(days=offset)
+        values = traffic_by_date.get(day)
+        if values:
+            input, output, credit = (round(value / divisor, 2)
+                                     for value in values)
+        else:
+            input, output, credit = 0.0, 0.0, 0.0
+        history.append((WEEKDAYS[day.strftime('%w')], input, output, credit))
+    return history
+
+
+# The bucket sizes of a long-range traffic history
+BUCKETS = ('day', 'week', 'month')
+
+# SQL expressions grouping `traffic.tuext` rows (aliased `t`) into buckets.
+# Day 0 of the timetags (1970-01-01) was a thursday, so weeks are shifted
+# by three days to start on mondays.
+TIMETAG_BUCKET_SQL = {
+    'day': "t.timetag",
+    'week': "FLOOR((t.timetag + 3) / 7) * 7 - 3",
+    'month': "EXTRACT(YEAR_MONTH FROM FROM_UNIXTIME(t.timetag * 86400))",
+}
+
+
+def date_from_bucket_key(key, bucket):
+    """Convert the value of a `TIMETAG_BUCKET_SQL` expression to the date
+    the bucket starts with.
+    """
+    key = int(key)
+    if bucket == 'month':
+        return date(key // 100, key % 100, 1)
+    return date.fromtimestamp(timestamp_from_timetag(key))
+
+
+def bucket_start(day, bucket):
+    """Return the first date of the bucket containing day"""
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(start, bucket):
+    if bucket == 'week':
+        return start + timedelta(days=7)
+    if bucket == 'month':
+        return (start + timedelta(days=31)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def history_start(today, days, bucket):
+    """Return the first date of a history of `days` days up to `today`.
+
+    It is the start of the bucket containing the first day, so all
+    buckets are complete.
+    """
+    return bucket_start(today - timedelta(days=days - 1), bucket)
+
+
+def sum_by_bucket(traffic_by_date, bucket):
+    """Sum up a dict of `(input, output)` tuples by date per bucket"""
+    sums = {}
+    for day, (input, output) in traffic_by_date.iteritems():
+        start = bucket_start(day, bucket)
+        previous_input, previous_output = sums.get(start, (0, 0))
+        sums[start] = (previous_input + input, previous_output + output)
+    return sums
+
+
+def build_bucketed_history(traffic_by_bucket, today, days, bucket,
+                           divisor=1.0):
+    """Return the traffic of the `days` days up to `today` per bucket.
+
+    :param traffic_by_bucket: A dict mapping the first date of a bucket
+        to its `(input, output)` tuple.  Missing buckets are filled with
+        zeros.
+    :param bucket: One of `BUCKETS`
+    :param divisor: The values are divided by it and rounded to two
+        digits
+    :return: A list of `(label, input, output, None)` tuples, oldest
+        first.  The credit is None, since it can not be summed up.
+    """
+    if bucket not in BUCKETS:
+        raise ValueError("Unknown bucket {!r}".format(bucket))
+
+    label_format = '%m/%Y' if bucket == 'month' else '%d.%m.'
+    history = []
+    start = history_start(today, days, bucket)
+    while start <= today:
+        input, output = (round(value / divisor, 2) for value in
+                         traffic_by_bucket.get(start, (0, 0)))
+        history.append((start.strftime(label_format), input, output, None))
+        start = next_bucket(start, bucket)
+    return history
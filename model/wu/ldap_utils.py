@@ -2,20 +2,37 @@
 from flask.ext.login import current_user
 from flask.globals import current_app
 import ldap
-from ldap.ldapobject import SimpleLDAPObject
+from ldap.filter import escape_filter_chars
 from werkzeug.local import LocalProxy
 
+from model.ldap_pool import LdapConnectionPool, LdapGroupIndex
+
 from sipa import logger
 from sipa.utils.exceptions import UserNotFound, PasswordInvalid, \
     LDAPConnectionError
 
 
+GROUP_BASE = 'ou=Gruppen,ou=Sektion Wundtstrasse,o=AG DSN,c=de'
+
+# the groups used by User.define_group()
+USER_GROUPS = ('Aktiv', 'Exaktiv')
+
+
 def init_ldap(app):
     app.extensions['ldap'] = {
         'host': app.config['LDAP_HOST'],
         'port': app.config['LDAP_PORT'],
-        'search_base': app.config['LDAP_SEARCH_BASE']
+        'search_base': app.config['LDAP_SEARCH_BASE'],
+        'pool': LdapConnectionPool(
+            "ldap://{}:{}".format(app.config['LDAP_HOST'],
+                                  app.config['LDAP_PORT']),
+            size=app.config['LDAP_POOL_SIZE'],
+            check_interval=app.config['LDAP_POOL_CHECK_INTERVAL'])
     }
+    if app.config['LDAP_GROUP_INDEX_TTL'] > 0:
+        app.extensions['ldap']['group_index'] = LdapGroupIndex(
+            app.extensions['ldap']['pool'], GROUP_BASE, USER_GROUPS,
+            ttl=app.config['LDAP_GROUP_INDEX_TTL'])
 
 
 CONF = LocalProxy(lambda: current_app.extensions['ldap'])
@@ -27,27 +44,47 @@ class LdapConnector(object):
     * If you pass it a username only, it will use an anonymous bind.
     * If you pass it a username and password, it will try to bind to LDAP with
         the users credentials.
+
+    The connection is taken from the connection pool and given back
+    (bound anonymously again) on exit.  The user's entry as returned by
+    `fetch_user()` is available as `user`.  If a pooled connection turns
+    out to be dead (`SERVER_DOWN`), it is discarded and entering is retried
+    once on a fresh connection, as in `LdapConnectionPool.search_s()`.
     """
 
     def __init__(self, username, password=None):
         self.username = username
         self.password = password
         self.l = None
+        self.user = None
 
     def __enter__(self):
         try:
-            user = self.fetch_user(self.username)
+            return self._enter()
+        except ldap.SERVER_DOWN:
+            # the pooled connection went stale, e.g. after an LDAP restart
+            return self._enter()
+
+    def _enter(self):
+        self.l = CONF['pool'].acquire()
+        entered = False
+        server_down = False
+        try:
+            user = self.fetch_user(self.username, self.l)
             if not user:
                 raise UserNotFound
-            self.l = ldap.initialize("ldap://{}:{}".format(CONF['host'],
-                                                           CONF['port']))
-            self.l.protocol_version = ldap.VERSION3
+
+            self.user = user
 
             if self.password:
                 self.l.simple_bind_s(user['dn'],
                                      self.password.encode('iso8859-1'))
 
+            entered = True
             return self.l
+        except ldap.SERVER_DOWN:
+            server_down = True
+            raise
         except ldap.INVALID_CREDENTIALS:
             raise PasswordInvalid
         except ldap.UNWILLING_TO_PERFORM:
@@ -55,25 +92,40 @@ class LdapConnector(object):
             raise PasswordInvalid
         except ldap.INSUFFICIENT_ACCESS:
             raise LDAPConnectionError
+        finally:
+            if not entered:
+                # a failed bind may leave the connection in any state
+                CONF['pool'].release(self.l, rebind=True,
+                                     discard=server_down)
+                self.l = None
+                if server_down:
+                    # the other idle connections are most likely dead, too
+                    CONF['pool'].clear()
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        if isinstance(self.l, SimpleLDAPObject):
-            self.l.unbind_s()
+        if self.l is not None:
+            server_down = (exc_type is not None
+                           and issubclass(exc_type, ldap.SERVER_DOWN))
+            CONF['pool'].release(self.l, rebind=bool(self.password),
+                                 discard=server_down)
+            self.l = None
 
     @staticmethod
-    def fetch_user(username):
+    def fetch_user(username, l=None):
         """Fetch a user by his username from LDAP.
         This method does not check the authenticity of the requested user!
 
         Returns a formatted dict with the LDAP dn, username and real name.
         If the username was not found, returns None.
+
+        :param l: An anonymously bound connection to use instead of a
+            pooled one
         """
-        l = ldap.initialize("ldap://{}:{}".format(CONF['host'], CONF['port']))
-        user = l.search_s(CONF['search_base'],
-                          ldap.SCOPE_SUBTREE,
-                          "(uid=%s)" % username,
-                          ['uid', 'gecos', 'mail'])
-        l.unbind_s()
+        search = CONF['pool'].search_s if l is None else l.search_s
+        user = search(CONF['search_base'],
+                      ldap.SCOPE_SUBTREE,
+                      "(uid=%s)" % username,
+                      ['uid', 'gecos', 'mail'])
 
         if user:
             user = user.pop()
@@ -99,18 +151,34 @@ def get_dn(l):
     return l.whoami_s()[3:]
 
 
+def search_in_groups(username, groups):
+    """Return the subset of the given LDAP groups containing the user in
+    their memberuid list.
+
+    If the groups are covered by the group index, it is used instead of
+    querying LDAP.  Else, all groups are searched at once.
+    """
+    index = CONF.get('group_index')
+    if index is not None and set(groups) <= set(index.groups):
+        return index.groups_of(username) & set(groups)
+
+    result = CONF['pool'].search_s(
+        GROUP_BASE, ldap.SCOPE_SUBTREE,
+        '(&(|{})(memberuid={}))'.format(
+            ''.join('(cn={})'.format(escape_filter_chars(group))
+                    for group in groups),
+            escape_filter_chars(username)),
+        ['cn'])
+
+    return {cn for _, attrs in result for cn in attrs.get('cn', [])
+            if cn in groups}
+
+
 def search_in_group(username, group):
     """Searches for the given user in the given LDAP group memberuid list.
     This replaces the previous usage of hostflags.
     """
-    with LdapConnector(username) as l:
-        group_object = l.search_s(
-            'cn=' + group + ',ou=Gruppen,ou=Sektion Wundtstrasse,o=AG DSN,c=de',
-            ldap.SCOPE_SUBTREE, '(memberuid=%s)' % username)
-
-        if group_object:
-            return True
-        return False
+    return bool(search_in_groups(username, (group,)))
 
 
 def change_email(username, password, email):
@@ -4,14 +4,14 @@ from flask.ext.login import AnonymousUserMixin
 from sqlalchemy.exc import OperationalError
 
 from model.constants import info_property, STATUS_COLORS, ACTIONS
-from model.default import BaseUser
+from model.default import BaseUser, lazy_field
 from model.wu.database_utils import ip_from_user_id, sql_query, \
-    update_macaddress, query_trafficdata, \
+    update_macaddress, query_trafficdata, query_traffic_history, \
     query_current_credit, create_mysql_userdatabase, drop_mysql_userdatabase, \
     change_mysql_userdatabase_password, user_has_mysql_db, \
     calculate_userid_checksum, DORMITORIES, status_string_from_id
-from model.wu.ldap_utils import search_in_group, LdapConnector, \
-    get_dn, change_email
+from model.wu.ldap_utils import search_in_groups, LdapConnector, \
+    get_dn, change_email, USER_GROUPS
 from sipa import logger
 from sipa.utils.exceptions import PasswordInvalid, UserNotFound, DBQueryEmpty
 
@@ -23,15 +23,31 @@ class User(BaseUser):
     the terms 'uid' and 'username' refer to the same thing.
     """
 
-    def __init__(self, uid, name, mail, ip=None):
-        super(User, self).__init__(uid)
-        self.name = name
-        self.group = self.define_group()
-        self.mail = mail
-        self._ip = ip
+    def __init__(self, uid, name=None, mail=None, ip=None):
+        super(User, self).__init__(uid, name=name, mail=mail, ip=ip)
+        self.from_ip_address = False
+
+    @lazy_field
+    def _ldap_user(self):
+        user = LdapConnector.fetch_user(self.uid)
+        if not user:
+            raise UserNotFound
+        return user
+
+    @lazy_field
+    def name(self):
+        return self._ldap_user['name']
+
+    @lazy_field
+    def mail(self):
+        return self._ldap_user['mail']
+
+    @lazy_field
+    def group(self):
+        return self.define_group()
 
     def _get_ip(self):
-        self._ip = ip_from_user_id(self.uid)
+        return ip_from_user_id(self.uid)
 
     def __repr__(self):
         return "User<{},{}.{}>".format(self.uid, self.name, self.group)
@@ -42,9 +58,10 @@ class User(BaseUser):
     def define_group(self):
         """Define a user group from the LDAP group
         """
-        if search_in_group(self.uid, 'Aktiv'):
+        groups = search_in_groups(self.uid, USER_GROUPS)
+        if 'Aktiv' in groups:
             return 'active'
-        elif search_in_group(self.uid, 'Exaktiv'):
+        elif 'Exaktiv' in groups:
             return 'exactive'
         return 'passive'
 
@@ -52,9 +69,21 @@ class User(BaseUser):
     def get(username, **kwargs):
         """Static method for flask-login user_loader,
         used before _every_ request.
+
+        Does not query LDAP, this is deferred until a field like
+        `name` is read.
         """
-        user = LdapConnector.fetch_user(username)
-        return User(user['uid'], user['name'], user['mail'], **kwargs)
+        return User(username, **kwargs)
+
+    @staticmethod
+    def from_ldap_user(ldap_user):
+        """Return the user of an entry as returned by `fetch_user()`,
+        with its canonical uid and fields taken from the entry.
+        """
+        user = User(ldap_user['uid'], name=ldap_user['name'],
+                    mail=ldap_user['mail'])
+        user._ldap_user = ldap_user
+        return user
 
     @staticmethod
     def authenticate(username, password):
@@ -63,8 +92,9 @@ class User(BaseUser):
         Returns the User object if successful.
         """
         try:
-            with LdapConnector(username, password):
-                return User.get(username)
+            connector = LdapConnector(username, password)
+            with connector:
+                return User.from_ldap_user(connector.user)
         except PasswordInvalid:
             logger.info('Failed login attempt (Wrong %s)', 'password',
                         extra={'data': {'username': username}})
@@ -81,7 +111,10 @@ class User(BaseUser):
         if result is None:
             return AnonymousUserMixin
 
-        return User.get(result['nutzer_id'], ip=ip)
+        user = User.get(result['nutzer_id'], ip=ip)
+        # its uid is not the unix account, so the credit is queried by ip
+        user.from_ip_address = True
+        return user
 
     def change_password(self, old, new):
         """Change a user's password from old to new
@@ -178,8 +211,13 @@ class User(BaseUser):
     def get_traffic_data(self):
         return query_trafficdata(self.ip, self.uid)
 
+    def get_traffic_history(self, days=30, bucket='week'):
+        return query_traffic_history(self.ip, self.uid, days, bucket)
+
     def get_current_credit(self):
-        return query_current_credit(self.uid, self.ip)
+        if self.from_ip_address:
+            return query_current_credit(ip=self.ip)
+        return query_current_credit(uid=self.uid)
 
     def change_mac_address(self, old_mac, new_mac):
         update_macaddress(self.ip, old_mac, new_mac)
@@ -1,26 +1,38 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
 
-from itertools import imap
 from babel.core import UnknownLocaleError, Locale
-from flask import request
+from flask import request, g
 from flask.ext.babel import Babel, get_locale
 
 babel = Babel()
 
 
 def locale_preferences():
-    main_locale = get_locale()
-    locales = [main_locale]
+    """Return the names of the locales preferred by the current request,
+    best first: the selected locale, then those of the Accept-Language
+    header.  For a locale with a territory (`en_US`), its language
+    (`en`) is added as a fallback.
 
-    def to_locale(language):
-        try:
-            return Locale(language)
-        except UnknownLocaleError:
-            return main_locale
+    The names are normalized the way `str(Locale)` does, so they can be
+    used as dict keys.  The list is memoized for the request.
+    """
+    preferences = getattr(g, '_locale_preferences', None)
+    if preferences is not None:
+        return preferences
 
-    locales.extend(imap(to_locale, request.accept_languages.itervalues()))
-    return locales
+    preferences = [str(get_locale())]
+    for language in request.accept_languages.itervalues():
+        try:
+            locale = Locale.parse(language, sep='-')
+        except (ValueError, UnknownLocaleError):
+            continue
+        for name in (str(locale), locale.language):
+            if name not in preferences:
+                preferences.append(name)
+
+    g._locale_preferences = preferences
+    return preferences
 
 
 def possible_locales():
@@ -9,13 +9,16 @@ from flask.ext.babel import get_locale
 from flask.ext.login import LoginManager, AnonymousUserMixin
 from werkzeug.routing import IntegerConverter as BaseIntegerConverter
 
-from model import registered_divisions, init_context, division_from_name
+from model import registered_divisions, init_context, user_from_name
 from model.constants import ACTIONS, STATUS_COLORS
 from sipa import logger
 from sipa.babel import babel, possible_locales
-from sipa.flatpages import cf_pages
+from sipa.flatpages import cf_pages, render_navigation
 from sipa.initialization import init_env_and_config, init_logging
-from sipa.utils.graph_utils import render_traffic_chart
+from sipa.utils.bustimes import init_bustimes
+from sipa.utils.cache import init_cache
+from sipa.utils.graph_utils import render_traffic_chart, chart_cache
+from sipa.utils.mail_utils import init_mail
 
 login_manager = LoginManager()
 
@@ -40,6 +43,9 @@ def init_app(app):
     init_env_and_config(app)
     logger.debug('Initializing app')
     login_manager.init_app(app)
+    init_cache(app)
+    chart_cache.maxsize = app.config['CHART_CACHE_SIZE']
+    chart_cache.maxbytes = app.config['CHART_CACHE_MAX_BYTES']
     babel.init_app(app)
     babel.localeselector(babel_selector)
     cf_pages.init_app(app)
@@ -73,6 +79,7 @@ def init_app(app):
     logger.debug('Registering Jinja globals')
     app.jinja_env.globals.update(
         cf_pages=cf_pages,
+        navigation=render_navigation,
         gauge_data=query_gauge_data,
         get_locale=get_locale,
         possible_locales=possible_locales,
@@ -83,6 +90,8 @@ def init_app(app):
 
     init_logging(app)
     init_context(app)
+    init_bustimes(app)
+    init_mail(app)
 
 
 @login_manager.user_loader
@@ -91,7 +100,7 @@ def load_user(username):
     """
     division_name = session.get('division', None)
     if division_name:
-        return division_from_name(division_name).user_class.get(username)
+        return user_from_name(division_name, username)
     else:
         return AnonymousUserMixin
 
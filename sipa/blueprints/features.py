@@ -9,7 +9,7 @@ and does not fit into any other blueprint such as “documents”.
 from flask import Blueprint
 from flask.templating import render_template
 from sipa import app
-from sipa.utils import get_bustimes
+from sipa.utils.bustimes import get_bustimes_cached, get_all_bustimes
 
 bp_features = Blueprint('features', __name__)
 
@@ -20,15 +20,16 @@ def bustimes(stopname=None):
     """Queries the VVO-Online widget for the given stop.
     If no specific stop is given in the URL, it will query all
     stops set up in the config.
+
+    Departures are cached shortly, missing stops are fetched concurrently.
     """
     data = {}
 
     if stopname:
         # Only one stop requested
-        data[stopname] = get_bustimes(stopname)
+        data[stopname] = get_bustimes_cached(stopname)
     else:
         # General output page
-        for stop in app.config['BUSSTOPS']:
-            data[stop] = get_bustimes(stop, 4)
+        data = get_all_bustimes(app.config['BUSSTOPS'], 4)
 
     return render_template('bustimes.html', times=data, stopname=stopname)
@@ -11,6 +11,7 @@ from flask.ext.login import current_user, login_user, logout_user, \
     login_required
 from sqlalchemy.exc import OperationalError
 from ldap import SERVER_DOWN
+from requests import RequestException
 
 from model import division_from_name, user_from_ip
 from model.default import BaseUser
@@ -84,6 +85,17 @@ def exceptionhandler_ldap(ex):
     return redirect(url_for('generic.index'))
 
 
+@bp_generic.app_errorhandler(RequestException)
+def exceptionhandler_api(ex):
+    """Handles global errors of HTTP APIs (unreachable or timed out).
+    """
+    flash(gettext("Verbindung zum API-Server konnte nicht hergestellt werden!"),
+          "error")
+    logger.critical('Unable to connect to API server',
+                    extra={'data': {'exception_args': ex.args}})
+    return redirect(url_for('generic.index'))
+
+
 @bp_generic.route("/language/<string:lang>")
 def set_language(lang='de'):
     """Set the session language via URL
@@ -6,6 +6,7 @@ Blueprint providing features regarding the news entries.
 """
 
 from flask import Blueprint, render_template, url_for, redirect
+from flask.ext.babel import get_locale
 
 from sipa.flatpages import cf_pages
 
@@ -20,13 +21,14 @@ def display(start=None, end=None):
     """Get all markdown files from 'content/news/', parse them and put
     them in a list for the template.
     The formatting of these files is described in the readme.
+
+    The pages are only parsed again if they have changed on disk.
     """
     cf_pages.reload()
-    news = cf_pages.get_articles_of_category('news')
+    news = cf_pages.get_articles_by_date('news', get_locale())
     if len(news) is 0:
         return render_template("index.html", articles=None,
                                previous_range=0, next_range=0)
-    news = sorted(news, key=lambda a: a.date, reverse=True)
 
     default_step = 10
     # calculating mod len() allows things like `end=-1` for the last article(s).
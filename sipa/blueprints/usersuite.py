@@ -4,11 +4,13 @@
 """Blueprint for Usersuite components
 """
 
-from flask import Blueprint, render_template, url_for, redirect, flash
+from flask import Blueprint, render_template, url_for, redirect, flash, \
+    session, request
 from flask.ext.babel import gettext
 from flask.ext.login import current_user, login_required
 
-from model import current_user_supported
+from model import current_user_supported, invalidate_user, \
+    remember_current_credit
 from model.constants import unsupported_property, ACTIONS
 from sipa import logger, feature_required
 from sipa.forms import ContactForm, ChangeMACForm, ChangeMailForm, \
@@ -29,8 +31,7 @@ def usersuite():
     and traffic overview.
     """
     try:
-        user_info = dict(current_user.get_information())
-        traffic_data = current_user.get_traffic_data()
+        dashboard = current_user.load_dashboard()
     except DBQueryEmpty as e:
         logger.error('Userinfo DB query could not be finished',
                      extra={'data': {'exception_args': e.args}, 'stack': True})
@@ -38,6 +39,11 @@ def usersuite():
               "error")
         return redirect(url_for('generic.index'))
 
+    user_info = dict(dashboard['information'])
+    traffic_data = dashboard['traffic']
+    if dashboard['credit'] is not None:
+        remember_current_credit(dashboard['credit'])
+
     user_info.update({prop: unsupported_property()
                       for prop in current_user.unsupported(display=True)})
 
@@ -80,6 +86,29 @@ def usersuite():
                            usertraffic=traffic_data)
 
 
+# The bucket of the traffic history for each selectable number of days
+TRAFFIC_HISTORY_RANGES = OrderedDict([(30, 'day'), (90, 'week'),
+                                      (365, 'month')])
+
+
+@bp_usersuite.route("/traffic")
+@login_required
+def usersuite_traffic():
+    """Traffic history of the last 30, 90 or 365 days, summed up per day,
+    week or month.
+    """
+    days = request.args.get('days', 30, type=int)
+    if days not in TRAFFIC_HISTORY_RANGES:
+        days = 30
+
+    traffic_history = current_user.get_traffic_history(
+        days, TRAFFIC_HISTORY_RANGES[days])
+
+    return render_template("usersuite/traffic.html",
+                           usertraffic=traffic_history, days=days,
+                           ranges=TRAFFIC_HISTORY_RANGES.keys())
+
+
 @bp_usersuite.route("/contact", methods=['GET', 'POST'])
 @login_required
 def usersuite_contact():
@@ -158,6 +187,7 @@ def usersuite_change_password():
             except PasswordInvalid:
                 flash(gettext(u"Altes Passwort war inkorrekt!"), "error")
             else:
+                invalidate_user(session['division'], current_user.uid)
                 flash(gettext(u"Passwort wurde geändert"), "success")
                 return redirect(url_for(".usersuite"))
     elif form.is_submitted():
@@ -191,6 +221,7 @@ def usersuite_change_mail():
         except LDAPConnectionError:
             flash(gettext(u"Nicht genügend LDAP-Rechte!"), "error")
         else:
+            invalidate_user(session['division'], current_user.uid)
             flash(gettext(u"E-Mail-Adresse wurde geändert"), "success")
             return redirect(url_for('.usersuite'))
     elif form.is_submitted():
@@ -222,6 +253,7 @@ def usersuite_delete_mail():
         except LDAPConnectionError:
             flash(gettext(u"Nicht genügend LDAP-Rechte!"), "error")
         else:
+            invalidate_user(session['division'], current_user.uid)
             flash(gettext(u"E-Mail-Adresse wurde zurückgesetzt"), "success")
             return redirect(url_for('.usersuite'))
     elif form.is_submitted():
@@ -36,6 +36,8 @@ else:
         'attr_list'
     ]
 FLATPAGES_MARKDOWN_EXTENSIONS = sipa_flatpages_markdown_extensions
+# Minimum number of seconds between two checks for changed content files
+CONTENT_CHECK_INTERVAL = int(os.getenv("SIPA_CONTENT_CHECK_INTERVAL", '10'))
 
 LOGGING_CONFIG_LOCATION = os.getenv("SIPA_LOGGING_CONFIG_LOCATION",
                                     "sipa/default_log_config")
@@ -44,11 +46,27 @@ GENERIC_LOGGING = True
 # Mail configuration
 MAILSERVER_HOST = os.getenv("SIPA_MAILSERVER_HOST", "127.0.0.1")
 MAILSERVER_PORT = int(os.getenv("SIPA_MAILSERVER_PORT", '25'))
+# Spool directory for sending mails in the background, empty to send directly
+MAIL_SPOOL_DIR = os.getenv("SIPA_MAIL_SPOOL_DIR", "")
+MAIL_TIMEOUT = int(os.getenv("SIPA_MAIL_TIMEOUT", '10'))
+MAIL_SEND_INTERVAL = int(os.getenv("SIPA_MAIL_SEND_INTERVAL", '10'))
+MAIL_BATCH_SIZE = int(os.getenv("SIPA_MAIL_BATCH_SIZE", '20'))
+# Delay before the first retry, doubled on each further attempt
+MAIL_RETRY_DELAY = int(os.getenv("SIPA_MAIL_RETRY_DELAY", '60'))
+MAIL_MAX_ATTEMPTS = int(os.getenv("SIPA_MAIL_MAX_ATTEMPTS", '8'))
+
+# Subnets of the divisions in addition to the ones they declare,
+# e.g. {'wu': ['192.0.2.0/24']}
+DIVISION_SUBNETS = {}
 
 # LDAP configuration
 LDAP_HOST = os.getenv("SIPA_LDAP_HOST", "127.0.0.1")
 LDAP_PORT = int(os.getenv("SIPA_LDAP_PORT", '389'))
 LDAP_SEARCH_BASE = os.getenv("SIPA_LDAP_SEARCH_BASE", "")
+LDAP_POOL_SIZE = int(os.getenv("SIPA_LDAP_POOL_SIZE", '4'))
+LDAP_POOL_CHECK_INTERVAL = int(os.getenv("SIPA_LDAP_POOL_CHECK_INTERVAL", '30'))
+# Seconds after which the group membership index is refreshed, 0 to disable
+LDAP_GROUP_INDEX_TTL = int(os.getenv("SIPA_LDAP_GROUP_INDEX_TTL", '0'))
 
 # MySQL configuration
 DB_ATLANTIS_HOST = os.getenv("SIPA_DB_ATLANTIS_HOST", "127.0.0.1")
@@ -63,9 +81,52 @@ DB_HELIOS_USER = os.getenv("SIPA_DB_HELIOS_USER", "")
 DB_HELIOS_PASSWORD = os.getenv("SIPA_DB_HELIOS_PASSWORD", "")
 
 SQL_TIMEOUT = int(os.getenv("SIPA_SQL_TIMEOUT", '15'))
+SQL_POOL_SIZE = int(os.getenv("SIPA_SQL_POOL_SIZE", '5'))
+SQL_POOL_MAX_OVERFLOW = int(os.getenv("SIPA_SQL_POOL_MAX_OVERFLOW", '10'))
+SQL_POOL_TIMEOUT = int(os.getenv("SIPA_SQL_POOL_TIMEOUT", '30'))
+# Recycle connections before MySQL's `wait_timeout` closes them
+SQL_POOL_RECYCLE = int(os.getenv("SIPA_SQL_POOL_RECYCLE", '3600'))
+SQL_POOL_PRE_PING = os.getenv("SIPA_SQL_POOL_PRE_PING", "True") == 'True'
+# Maximum execution time of a statement in seconds, 0 to disable
+SQL_STATEMENT_TIMEOUT = int(os.getenv("SIPA_SQL_STATEMENT_TIMEOUT", '0'))
+
+# Cache shared by all workers: null, simple, filesystem, memcached or uwsgi
+CACHE_TYPE = os.getenv("SIPA_CACHE_TYPE", "simple")
+CACHE_KEY_PREFIX = os.getenv("SIPA_CACHE_KEY_PREFIX", "sipa:")
+CACHE_DIR = os.getenv("SIPA_CACHE_DIR", "/tmp/sipa_cache")
+CACHE_MEMCACHED_SERVERS = os.getenv("SIPA_CACHE_MEMCACHED_SERVERS",
+                                    "127.0.0.1:11211").split(',')
+CACHE_UWSGI_NAME = os.getenv("SIPA_CACHE_UWSGI_NAME", "")
+
+# Seconds the credit shown in the gauge is cached
+GAUGE_CACHE_TIMEOUT = int(os.getenv("SIPA_GAUGE_CACHE_TIMEOUT", '300'))
+
+# Renderer of the traffic chart: pygal or svg (built-in template)
+TRAFFIC_CHART_RENDERER = os.getenv("SIPA_TRAFFIC_CHART_RENDERER", "pygal")
+
+# Cache of rendered traffic charts (per worker)
+CHART_CACHE_SIZE = int(os.getenv("SIPA_CHART_CACHE_SIZE", '256'))
+CHART_CACHE_MAX_BYTES = int(os.getenv("SIPA_CHART_CACHE_MAX_BYTES",
+                                      str(4 * 1024 ** 2)))
+
+# User cache used by the flask-login user_loader.  It is local to each
+# worker, invalidations are passed on through the shared cache.
+USER_CACHE_SIZE = int(os.getenv("SIPA_USER_CACHE_SIZE", '1024'))
+USER_CACHE_TTL = int(os.getenv("SIPA_USER_CACHE_TTL", '300'))
+# Users (or their absence) by IP, for anonymous requests
+IP_USER_CACHE_SIZE = int(os.getenv("SIPA_IP_USER_CACHE_SIZE", '4096'))
+IP_USER_CACHE_TTL = int(os.getenv("SIPA_IP_USER_CACHE_TTL", '60'))
 
 GEROK_ENDPOINT = os.getenv("SIPA_GEROK_ENDPOINT", "https://127.0.0.1/")
 GEROK_API_TOKEN = os.getenv("SIPA_GEROK_API_TOKEN", "")
+GEROK_CONNECT_TIMEOUT = float(os.getenv("SIPA_GEROK_CONNECT_TIMEOUT", '3.05'))
+GEROK_READ_TIMEOUT = float(os.getenv("SIPA_GEROK_READ_TIMEOUT", '10'))
+GEROK_RETRIES = int(os.getenv("SIPA_GEROK_RETRIES", '2'))
+# Connections kept open to GEROK_ENDPOINT per worker
+GEROK_POOL_SIZE = int(os.getenv("SIPA_GEROK_POOL_SIZE", '10'))
+# API responses younger than this are used without revalidating them
+GEROK_CACHE_TTL = int(os.getenv("SIPA_GEROK_CACHE_TTL", '60'))
+GEROK_CACHE_SIZE = int(os.getenv("SIPA_GEROK_CACHE_SIZE", '1024'))
 
 # Languages
 LANGUAGES = {
@@ -79,3 +140,13 @@ BUSSTOPS = [
     "Strehlener Platz",
     "Weberplatz"
 ]
+
+BUSTIMES_HOST = os.getenv("SIPA_BUSTIMES_HOST", "widgets.vvo-online.de")
+BUSTIMES_TIMEOUT = int(os.getenv("SIPA_BUSTIMES_TIMEOUT", '1'))
+# Departures younger than this are served without refreshing them
+BUSTIMES_CACHE_TIMEOUT = int(os.getenv("SIPA_BUSTIMES_CACHE_TIMEOUT", '30'))
+# Older departures are served while being refreshed in the background
+BUSTIMES_STALE_TIMEOUT = int(os.getenv("SIPA_BUSTIMES_STALE_TIMEOUT", '300'))
+BUSTIMES_THREADS = int(os.getenv("SIPA_BUSTIMES_THREADS", '4'))
+# Poll BUSSTOPS in the background every n seconds, 0 to fetch on demand
+BUSTIMES_POLL_INTERVAL = int(os.getenv("SIPA_BUSTIMES_POLL_INTERVAL", '0'))
@@ -1,10 +1,19 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
-from flask import abort
+from threading import Lock
+import os
+import time
+
+from flask import abort, render_template, request
 from babel.core import UnknownLocaleError, Locale
 from flask.ext.flatpages import FlatPages
 
+from sipa import logger
 from .babel import babel, locale_preferences
+from .utils.cache import LRUCache
+
+# rendered HTML of the navigation, cleared on every rebuild
+fragment_cache = LRUCache(maxsize=512)
 
 
 def compare(x, y):
@@ -46,16 +55,18 @@ class Article(Node):
         except KeyError:
             raise AttributeError()
 
+    def page_for_locale(self, locale):
+        """Return the page of the given locale or the default page"""
+        return self.localized_pages.get(str(locale), self.default_page)
+
     @property
     def localized_page(self):
-        available_locales = self.localized_pages.keys()
+        # localized_pages is keyed by locale names, because Locale is
+        # unfortunately not hashable
         for locale in locale_preferences():
-            # Locale is unfortunately not hashable
-            # so locale in self.localized_pages does not work
-            for available_locale in available_locales:
-                if available_locale == locale:
-                    localized_page = self.localized_pages.get(available_locale)
-                    return localized_page
+            localized_page = self.localized_pages.get(locale)
+            if localized_page is not None:
+                return localized_page
         return self.default_page
 
 
@@ -64,6 +75,32 @@ class Category(Node):
         super(Category, self).__init__(parent, id)
         self.categories = {}
         self.articles = {}
+        # articles sorted by date (newest first) by locale name
+        self.articles_by_date = {}
+
+    def index_articles_by_date(self):
+        """Sort the articles by their date once for every locale they are
+        available in.  Articles without a date are left out of the index.
+        """
+        articles = [a for a in self.articles.values() if a.id != 'index']
+        locales = {locale for article in articles
+                   for locale in article.localized_pages}
+
+        articles_by_date = {}
+        for locale in locales:
+            dated_articles = []
+            for article in articles:
+                date = article.page_for_locale(locale).meta.get('date')
+                if date is None:
+                    logger.warning('Article %s/%s has no date and is left '
+                                   'out of the news for locale %s',
+                                   self.id, article.id, locale)
+                    continue
+                dated_articles.append((date, article))
+            dated_articles.sort(key=lambda pair: pair[0], reverse=True)
+            articles_by_date[locale] = [article
+                                        for _, article in dated_articles]
+        self.articles_by_date = articles_by_date
 
     def articles_itterator(self):
         return iter(sorted(self.articles.values(), cmp=compare))
@@ -99,19 +136,38 @@ class Category(Node):
             article = Article(self, article_id)
             article.default_page = page
             self.articles[article_id] = article
-        article.localized_pages[locale] = page
+        article.localized_pages[str(locale)] = page
         if locale == babel.default_locale:
             article.default_page = page
 
 
 class CategorizedFlatPages(object):
+    """The flatpages, sorted into a tree of categories.
+
+    The tree is only rebuilt by `reload()` if a content file has been
+    added, removed or modified, which is checked at most every
+    `CONTENT_CHECK_INTERVAL` seconds.  A rebuilt tree replaces the old
+    one at once, so concurrent requests always see a complete tree.
+    Every rebuild increases `revision` and clears `fragment_cache`.
+    """
+
     def __init__(self):
         self.flat_pages = FlatPages()
         self.root_category = Category(None, '<root>')
+        self.revision = 0
+        self.root = None
+        self.extension = None
+        self.check_interval = 0
+        self._signature = None
+        self._last_check = 0
+        self._lock = Lock()
 
     def init_app(self, app):
         self.flat_pages.init_app(app)
-        self._set_categories()
+        self.root = os.path.join(app.root_path, app.config['FLATPAGES_ROOT'])
+        self.extension = app.config['FLATPAGES_EXTENSION']
+        self.check_interval = app.config['CONTENT_CHECK_INTERVAL']
+        self.reload(force=True)
 
     def __iter__(self):
         return iter(sorted(self.root_category.categories.values(),
@@ -133,24 +189,100 @@ class CategorizedFlatPages(object):
                     barticles.append(a)
         return barticles
 
+    def get_articles_by_date(self, category_id, locale):
+        """Return the articles of a category sorted by date, newest first.
+
+        The list has been sorted when the tree was built, so it must not be
+        modified.
+        """
+        category = self.root_category.categories.get(category_id)
+        if category is None:
+            return []
+        articles_by_date = category.articles_by_date
+        try:
+            return articles_by_date[str(locale)]
+        except KeyError:
+            return articles_by_date.get(str(babel.default_locale), [])
+
     def get_or_404(self, category_id, article_id):
         page = self.get(category_id, article_id)
         if page is None:
             abort(404)
         return page
 
-    def _set_categories(self):
+    def _set_categories(self, root_category):
         for page in self.flat_pages:
             components = page.path.split('/')
-            parent = self.root_category
+            parent = root_category
             for category_id in components[:-1]:
                 parent = parent.add_category(category_id)
             page_name = components[-1]
             parent.add_article(page_name, page)
+        for category in root_category.categories.itervalues():
+            category.index_articles_by_date()
+
+    def _scan(self):
+        """Return a signature of all content files, which changes whenever
+        a file is added, removed or modified.
+        """
+        signature = []
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+            for filename in filenames:
+                if filename.endswith(self.extension):
+                    try:
+                        stat = os.stat(os.path.join(dirpath, filename))
+                    except OSError:
+                        # removed since the walk listed it, e.g. by a
+                        # content update; the next check sees it gone
+                        continue
+                    signature.append((dirpath, filename, stat.st_ino,
+                                      stat.st_mtime, stat.st_size))
+        return sorted(signature)
+
+    def reload(self, force=False):
+        """Rebuild the category tree if the content has changed.
 
-    def reload(self):
-        self.flat_pages.reload()
-        self._set_categories()
+        :param force: Rebuild without checking for changes
+        :return: Whether the tree has been rebuilt
+        """
+        now = time.time()
+        if not force and now - self._last_check < self.check_interval:
+            return False
+        # another thread checking already is as good as checking
+        if not self._lock.acquire(force):
+            return False
+        try:
+            self._last_check = now
+            signature = self._scan()
+            if not force and signature == self._signature:
+                return False
+
+            self.flat_pages.reload()
+            root_category = Category(None, '<root>')
+            self._set_categories(root_category)
+            self.root_category = root_category
+            self._signature = signature
+            self.revision += 1
+            fragment_cache.clear()
+            return True
+        finally:
+            self._lock.release()
 
 
 cf_pages = CategorizedFlatPages()
+
+
+def render_navigation():
+    """Render the categories part of the navigation bar.
+
+    The result only depends on the content, the locale preferences and
+    the script root, so it is cached for these.
+    """
+    key = ('navigation', cf_pages.revision, request.script_root,
+           tuple(locale_preferences()))
+    navigation = fragment_cache.get(key)
+    if navigation is None:
+        navigation = render_template('drafts/_navigation.html')
+        fragment_cache.set(key, navigation)
+    return navigation
@@ -7,6 +7,7 @@ from raven.contrib.flask import Sentry
 from raven.handlers.logging import SentryHandler
 
 from sipa import logger
+from sipa.flatpages import cf_pages
 from sipa.utils.git_utils import init_repo, update_repo
 
 
@@ -31,6 +32,8 @@ def init_env_and_config(app):
         def update_uwsgi(signum):
             hasToReload = update_repo(app.config["FLATPAGES_ROOT"])
             if hasToReload:
+                # the other workers notice the change on their next check
+                cf_pages.reload(force=True)
                 uwsgi.reload
 
         uwsgi.register_signal(20, "", update_uwsgi)
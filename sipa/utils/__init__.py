@@ -5,7 +5,10 @@
 General utilities
 """
 
+from itertools import islice
+import codecs
 import httplib
+import json
 import socket
 import time
 from flask import request, url_for
@@ -30,44 +33,107 @@ def timestamp_from_timetag(timetag):
     return timetag * 86400
 
 
-def get_bustimes(stopname, count=10):
+def iter_json_array(stream, chunk_size=512):
+    """Incrementally parse a JSON array read from a file-like object.
+
+    The elements are yielded as soon as they have been read completely,
+    so nothing after the last consumed element is read from `stream`.
+    The stream has to be encoded in UTF-8.
+
+    :raises ValueError: if the data is not a valid JSON array
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    buf, pos, eof = u'', 0, False
+    # what comes next: '[', the first value, a value or ',' / ']'
+    expected = '['
+
+    while True:
+        while pos < len(buf) and buf[pos] in u' \t\r\n':
+            pos += 1
+
+        need_more = pos == len(buf)
+        if not need_more:
+            if expected == '[':
+                if buf[pos] != u'[':
+                    raise ValueError("Expected '[' at {}".format(pos))
+                pos += 1
+                expected = 'first'
+            elif expected == 'first' and buf[pos] == u']':
+                return
+            elif expected in ('first', 'value'):
+                try:
+                    value, end = decoder.raw_decode(buf, pos)
+                except ValueError:
+                    # the value might be incomplete
+                    if eof:
+                        raise
+                    need_more = True
+                else:
+                    # a number is only complete once it is delimited, since
+                    # e.g. `0.5` might have been cut after `0.`
+                    if (buf[pos] in u'-0123456789' and not eof
+                            and (end == len(buf)
+                                 or buf[end] not in u',] \t\r\n')):
+                        need_more = True
+                    else:
+                        pos = end
+                        expected = ','
+                        yield value
+            else:
+                if buf[pos] == u']':
+                    return
+                if buf[pos] != u',':
+                    raise ValueError("Expected ',' or ']' at {}".format(pos))
+                pos += 1
+                expected = 'value'
+
+        if need_more:
+            if eof:
+                raise ValueError("Unexpected end of JSON array")
+            chunk = stream.read(chunk_size)
+            eof = not chunk
+            buf = buf[pos:] + text_decoder.decode(chunk, final=eof)
+            pos = 0
+
+
+def get_bustimes(stopname, count=10, host='widgets.vvo-online.de', timeout=1):
     """Parses the VVO-Online API return string.
     API returns in format [["line", "to", "minutes"],[__],[__]], where "__" are
     up to nine more Elements.
 
+    The response is parsed incrementally and not read any further once
+    `count` entries have been parsed.
+
     :param stopname: Requested stop.
     :param count: Limit the entries for the stop.
+    :param host: The host serving the widget, e.g. a local stand-in
+    :param timeout: The timeout of the HTTP connection in seconds
     """
-    conn = httplib.HTTPConnection('widgets.vvo-online.de', timeout=1)
+    conn = httplib.HTTPConnection(host, timeout=timeout)
 
     stopname = stopname.replace(' ', '%20')
+    data = []
     try:
         conn.request('GET',
                      '/abfahrtsmonitor/Abfahrten.do?ort=Dresden&hst={0}'.format(
                          stopname))
         r = conn.getresponse()
-    except socket.error:
-        return None
 
-    r_data = r.read()
-
-    data = []
-    entry_count = 0
-
-    for i in r_data[2:-2].split('],['):
-        if entry_count == count:
-            break
-        entry_count += 1
-
-        tmpdata = i[1:-1].split('","')
-        try:
+        for entry in islice(iter_json_array(r), count):
+            line, direction, minutes = entry[:3]
             try:
-                data.append(
-                    [tmpdata[0], tmpdata[1].decode('utf8'), int(tmpdata[2])])
+                minutes = int(minutes)
             except ValueError:
-                data.append([tmpdata[0], tmpdata[1].decode('utf8'), 0])
-        except IndexError:
-            return None
+                minutes = 0
+            data.append([line, direction, minutes])
+    except socket.error:
+        return None
+    except (ValueError, TypeError):
+        # malformed response or entry
+        return None
+    finally:
+        conn.close()
 
     return data
 
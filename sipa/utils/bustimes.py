@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Cached and concurrent access to the VVO-Online departure monitor
+
+Departures are kept in the shared cache.  An entry younger than
+`BUSTIMES_CACHE_TIMEOUT` seconds is served as it is.  An older one is
+still served (stale-while-revalidate) while a background thread fetches
+a new one, until it is dropped from the cache after
+`BUSTIMES_STALE_TIMEOUT` seconds.
+
+If `BUSTIMES_POLL_INTERVAL` is set, the stops of `BUSSTOPS` are instead
+polled in the background by `init_bustimes()`, and requests for them
+only read the cache, unless the poller has not filled it.
+"""
+
+from hashlib import sha1
+from multiprocessing.pool import ThreadPool
+from threading import Thread, Lock
+import os
+import time
+
+from flask import current_app
+
+from sipa import logger
+from sipa.utils import get_bustimes
+from sipa.utils.cache import cache
+
+# the number of departures fetched by the poller
+POLL_COUNT = 10
+
+_pool = None
+_pool_pid = None
+_pool_lock = Lock()
+
+
+def _get_pool(size):
+    """Return the thread pool of the current process"""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ThreadPool(size)
+            _pool_pid = os.getpid()
+        return _pool
+
+
+class BustimesFetcher(object):
+    """Fetches departures using the settings of the current app.
+
+    It does not need an app context itself, so it can be used in other
+    threads.
+    """
+
+    def __init__(self, config, backend):
+        self.host = config['BUSTIMES_HOST']
+        self.timeout = config['BUSTIMES_TIMEOUT']
+        self.fresh_timeout = config['BUSTIMES_CACHE_TIMEOUT']
+        self.stale_timeout = config['BUSTIMES_STALE_TIMEOUT']
+        self.pool_size = config['BUSTIMES_THREADS']
+        self.polled_stops = (set(config['BUSSTOPS'])
+                             if config['BUSTIMES_POLL_INTERVAL'] > 0
+                             else set())
+        self.cache = backend
+
+    @classmethod
+    def from_app(cls):
+        return cls(current_app.config, cache._get_current_object())
+
+    @staticmethod
+    def cache_key(stopname, count):
+        if isinstance(stopname, unicode):
+            stopname = stopname.encode('utf-8')
+        return 'bustimes:{}:{}'.format(sha1(stopname).hexdigest(), count)
+
+    def fetch(self, stopname, count):
+        """Query the widget and store a successful result in the cache"""
+        data = get_bustimes(stopname, count, host=self.host,
+                            timeout=self.timeout)
+        if data is not None:
+            self.cache.set(self.cache_key(stopname, count),
+                           (time.time(), data), timeout=self.stale_timeout)
+        return data
+
+    def _revalidate(self, stopname, count):
+        """Fetch in the background, unless another worker already does"""
+        lock_key = self.cache_key(stopname, count) + ':refreshing'
+        if self.cache.add(lock_key, True, timeout=self.timeout + 1):
+            thread = Thread(target=self.fetch, args=(stopname, count))
+            thread.daemon = True
+            thread.start()
+
+    def cached(self, stopname, count):
+        """Return the cached departures of a stop, triggering a background
+        refresh if they are stale.
+
+        Polled stops are never refreshed here, but taken from what the
+        poller stored.  If it has not stored anything (yet, or in this
+        process), `get()` fetches them on demand.
+
+        :return: The departures or None if nothing is cached
+        """
+        if stopname in self.polled_stops:
+            entry = self.cache.get(self.cache_key(stopname, POLL_COUNT))
+            return entry[1][:count] if entry is not None else None
+
+        entry = self.cache.get(self.cache_key(stopname, count))
+        if entry is None:
+            return None
+        fetched_at, data = entry
+        if time.time() - fetched_at > self.fresh_timeout:
+            self._revalidate(stopname, count)
+        return data
+
+    def fetch_missing(self, stopname, count):
+        """Fetch a stop missing in the cache.
+
+        Polled stops are fetched (and stored) like the poller does it.
+        """
+        if stopname not in self.polled_stops:
+            return self.fetch(stopname, count)
+        data = self.fetch(stopname, POLL_COUNT)
+        return data[:count] if data is not None else None
+
+    def get(self, stopname, count=10):
+        data = self.cached(stopname, count)
+        if data is None:
+            data = self.fetch_missing(stopname, count)
+        return data
+
+    def get_all(self, stopnames, count=10):
+        """Return a dict of the departures of all stops.
+
+        Stops missing in the cache are fetched concurrently.
+        """
+        data = {stop: self.cached(stop, count) for stop in stopnames}
+        missing = [stop for stop, times in data.iteritems() if times is None]
+        if len(missing) == 1:
+            data[missing[0]] = self.fetch_missing(missing[0], count)
+        elif missing:
+            results = _get_pool(self.pool_size).map(
+                lambda stop: self.fetch_missing(stop, count), missing)
+            data.update(zip(missing, results))
+        return data
+
+    def poll(self):
+        """Fetch all polled stops concurrently"""
+        _get_pool(self.pool_size).map(
+            lambda stop: self.fetch(stop, POLL_COUNT), self.polled_stops)
+
+
+def init_bustimes(app):
+    """Start polling the configured stops every `BUSTIMES_POLL_INTERVAL`
+    seconds, if set.
+
+    Under uwsgi, a timer signal lets one worker poll, so `CACHE_TYPE`
+    should be shared between workers (not `simple`); else, the other
+    workers fetch the stops on demand.  Without uwsgi, a daemon thread
+    is started.
+    """
+    interval = app.config['BUSTIMES_POLL_INTERVAL']
+    if interval <= 0:
+        return
+
+    fetcher = BustimesFetcher(app.config, app.extensions['cache'])
+
+    if os.getenv("SIPA_UWSGI", "False") == 'True':
+        import uwsgi
+
+        if app.config['CACHE_TYPE'] in ('null', 'simple'):
+            logger.warning('Polling bus stops with CACHE_TYPE %r, which is '
+                           'not shared between workers',
+                           app.config['CACHE_TYPE'])
+
+        def poll_uwsgi(signum):
+            fetcher.poll()
+
+        uwsgi.register_signal(21, "", poll_uwsgi)
+        uwsgi.add_timer(21, interval)
+    else:
+        def poll_forever():
+            while True:
+                fetcher.poll()
+                time.sleep(interval)
+
+        thread = Thread(target=poll_forever, name='bustimes-poller')
+        thread.daemon = True
+        thread.start()
+
+
+def get_bustimes_cached(stopname, count=10):
+    """`get_bustimes()` served from the shared cache if possible"""
+    return BustimesFetcher.from_app().get(stopname, count)
+
+
+def get_all_bustimes(stopnames, count=10):
+    """Return the departures of several stops, fetching missing ones
+    concurrently.
+    """
+    return BustimesFetcher.from_app().get_all(stopnames, count)
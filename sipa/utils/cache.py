@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Caches shared by the different sipa and model modules
+
+`LRUCache` is local to the worker process, while the backend set up by
+`init_cache()` can be shared between all (uwsgi) workers.
+"""
+
+from collections import OrderedDict
+from threading import RLock
+import time
+
+from flask.globals import current_app
+from werkzeug.contrib.cache import NullCache, SimpleCache, FileSystemCache, \
+    MemcachedCache
+from werkzeug.local import LocalProxy
+
+
+def init_cache(app):
+    """Set up the shared cache backend as given by `CACHE_TYPE`.
+
+    Supported are `null`, `simple` (process local), `filesystem`,
+    `memcached` and `uwsgi`.
+    """
+    cache_type = app.config['CACHE_TYPE']
+    prefix = app.config['CACHE_KEY_PREFIX']
+
+    if cache_type == 'null':
+        backend = NullCache()
+    elif cache_type == 'simple':
+        backend = SimpleCache()
+    elif cache_type == 'filesystem':
+        backend = FileSystemCache(app.config['CACHE_DIR'])
+    elif cache_type == 'memcached':
+        backend = MemcachedCache(app.config['CACHE_MEMCACHED_SERVERS'],
+                                 key_prefix=prefix)
+    elif cache_type == 'uwsgi':
+        # only available since werkzeug 0.11
+        from werkzeug.contrib.cache import UWSGICache
+        backend = UWSGICache(cache=app.config['CACHE_UWSGI_NAME'])
+    else:
+        raise ValueError("Unknown CACHE_TYPE {!r}".format(cache_type))
+
+    app.extensions['cache'] = backend
+
+
+cache = LocalProxy(lambda: current_app.extensions['cache'])
+
+
+class LRUCache(object):
+    """A thread safe least-recently-used cache with optional expiry.
+
+    Entries are evicted in LRU order as soon as more than `maxsize`
+    entries are stored.  If `ttl` is given, entries older than `ttl`
+    seconds are treated as missing.  Hits and misses are counted to
+    make the cache's effectiveness observable.
+
+    If `maxbytes` is given, entries are also evicted as long as the sum
+    of their sizes (as determined by `getsizeof`) exceeds it.  Values
+    bigger than `maxbytes` are not stored at all.
+
+    :param maxsize: The maximum number of entries
+    :param ttl: The lifetime of an entry in seconds, None for no expiry
+    :param maxbytes: The maximum total size of all values, None for no limit
+    :param getsizeof: A callable returning the size of a value
+    """
+
+    def __init__(self, maxsize=128, ttl=None, maxbytes=None, getsizeof=len):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self.getsizeof = getsizeof
+        self.hits = 0
+        self.misses = 0
+        self.currbytes = 0
+        self._entries = OrderedDict()
+        self._lock = RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._lookup(key) is not None
+
+    def _lookup(self, key):
+        """Return the (timestamp, value, size) tuple for key or None if it
+        is missing or has expired.  Must be called with the lock held.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self.ttl is not None and time.time() - entry[0] > self.ttl:
+            self._remove(key)
+            return None
+        return entry
+
+    def _remove(self, key):
+        """Remove key if present.  Must be called with the lock held."""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.currbytes -= entry[2]
+
+    def _is_full(self):
+        return (len(self._entries) > self.maxsize
+                or (self.maxbytes is not None
+                    and self.currbytes > self.maxbytes))
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            # mark as most recently used
+            del self._entries[key]
+            self._entries[key] = entry
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        size = self.getsizeof(value) if self.maxbytes is not None else 0
+        with self._lock:
+            self._remove(key)
+            if self.maxbytes is not None and size > self.maxbytes:
+                return
+            self._entries[key] = (time.time(), value, size)
+            self.currbytes += size
+            while self._is_full():
+                self._remove(next(iter(self._entries)))
+
+    def delete(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.currbytes = 0
+
+    def stats(self):
+        """Return a dict of the current size and the hit/miss counters"""
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'bytes': self.currbytes,
+                'maxbytes': self.maxbytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
@@ -1,11 +1,19 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import pygal
-from pygal.style import BlueStyle
+from hashlib import sha1
+from math import ceil, floor, log10
+
 from _locale import gettext
+from flask import current_app, render_template
+from flask.ext.babel import get_locale
 from operator import add
 
+from sipa.utils.cache import LRUCache
+
+# rendered svg code by a hash of the traffic history and the locale
+chart_cache = LRUCache(maxsize=256, maxbytes=4 * 1024 ** 2)
+
 
 def generate_traffic_chart(traffic_data, inline=True):
     """Create a graph object from the input traffic data with pygal.
@@ -16,6 +24,10 @@ def generate_traffic_chart(traffic_data, inline=True):
     :param inline: Determines the option `disable_xml_declaration`
     :return: The graph object
     """
+    # pygal is imported here, so the native renderer does not load it at all
+    import pygal
+    from pygal.style import BlueStyle
+
     traffic_chart = pygal.Bar(
         title=gettext("Traffic (MB)"),
         height=350,
@@ -37,9 +49,108 @@ def generate_traffic_chart(traffic_data, inline=True):
     return traffic_chart
 
 
+CHART_COLORS = ('#00b2f0', '#43d9be', '#0662ab')
+
+
+def nice_step(maximum, steps=5):
+    """Return a round step width (1, 2 or 5 times a power of ten) dividing
+    [0, maximum] into at most about `steps` parts.
+    """
+    if maximum <= 0:
+        return 1
+    raw_step = float(maximum) / steps
+    magnitude = 10 ** floor(log10(raw_step))
+    for factor in (1, 2, 5, 10):
+        if factor * magnitude >= raw_step:
+            return factor * magnitude
+
+
+def render_traffic_chart_svg(traffic_data, inline=True, width=800,
+                             height=350):
+    """Render a bar chart equivalent to `generate_traffic_chart()` using
+    the `drafts/_traffic_chart.svg` template instead of pygal.
+
+    :param traffic_data: The traffic data as given by `query_trafficdata()`
+    :param inline: Whether to omit the xml declaration
+    :return: String
+    """
+    days, in_values, out_values, credit = zip(*traffic_data['history'])
+    series = [
+        (gettext('Input'), in_values),
+        (gettext('Output'), out_values),
+        (gettext('Gesamt'), map(add, in_values, out_values)),
+    ]
+
+    plot = {'left': 60, 'right': width - 20, 'top': 40, 'bottom': height - 50}
+    plot['width'] = plot['right'] - plot['left']
+    plot['height'] = plot['bottom'] - plot['top']
+
+    maximum = max(max(values) for _, values in series)
+    step = nice_step(maximum)
+    y_max = step * max(1, ceil(maximum / step))
+
+    def y_of(value):
+        return plot['bottom'] - plot['height'] * value / y_max
+
+    guides = []
+    value = 0
+    while value <= y_max:
+        guides.append({'y': round(y_of(value), 2),
+                       'label': '{:g}'.format(value)})
+        value += step
+
+    group_width = float(plot['width']) / len(days)
+    bar_width = group_width * 0.8 / len(series)
+    groups = []
+    for i, day in enumerate(days):
+        left = plot['left'] + i * group_width + group_width * 0.1
+        groups.append({
+            'label': day,
+            'center': round(left + group_width * 0.4, 2),
+            'bars': [{
+                'x': round(left + j * bar_width, 2),
+                'y': round(y_of(values[i]), 2),
+                'width': round(bar_width, 2),
+                'height': round(plot['bottom'] - y_of(values[i]), 2),
+                'color': CHART_COLORS[j],
+                'series': label,
+                'value': values[i],
+            } for j, (label, values) in enumerate(series)],
+        })
+
+    legend = [{'x': plot['left'] + j * 120, 'label': label,
+               'color': CHART_COLORS[j]}
+              for j, (label, _) in enumerate(series)]
+
+    return render_template('drafts/_traffic_chart.svg',
+                           title=gettext("Traffic (MB)"), inline=inline,
+                           width=width, height=height, plot=plot,
+                           guides=guides, groups=groups, legend=legend)
+
+
+def chart_cache_key(traffic_data, **kwargs):
+    """Hash everything the rendered chart depends on"""
+    return sha1(repr((
+        tuple(traffic_data['history']),
+        str(get_locale()),
+        sorted(kwargs.items()),
+    ))).hexdigest()
+
+
 def render_traffic_chart(traffic_data, **kwargs):
     """Generate pure svg code ready to be included in HTML inside a <figure>.
+
+    Identical charts are served from `chart_cache`.  The renderer is
+    chosen by `TRAFFIC_CHART_RENDERER` (`pygal` or `svg`).
     :param traffic_data: The traffic data as in generate_traffic_chart()
     :return: String
     """
-    return generate_traffic_chart(traffic_data, **kwargs).render()
+    key = chart_cache_key(traffic_data, **kwargs)
+    svg = chart_cache.get(key)
+    if svg is None:
+        if current_app.config['TRAFFIC_CHART_RENDERER'] == 'svg':
+            svg = render_traffic_chart_svg(traffic_data, **kwargs)
+        else:
+            svg = generate_traffic_chart(traffic_data, **kwargs).render()
+        chart_cache.set(key, svg)
+    return svg
@@ -3,12 +3,22 @@
 
 """
 Utils for sending emails via SMTP on localhost.
+
+If `MAIL_SPOOL_DIR` is set, mails are not sent during the request but
+written to an on-disk spool (see `MailOutbox`), which is drained in the
+background by `init_mail()`.
 """
 
 from email.utils import formatdate
 from email.mime.text import MIMEText
+from itertools import count
+from threading import Event, Lock, Thread
+import json
+import os
 import smtplib
+import socket
 import textwrap
+import time
 
 from sipa import app, logger
 
@@ -26,20 +36,47 @@ def wrap_message(message, chars_in_line=80):
     return '\n'.join(return_text)
 
 
+def compose_mail(sender, receipient, subject, message):
+    """Return the MIME text mail with the message wrapped to 80 characters
+    and encoded to UTF8.
+    """
+    mail = MIMEText(wrap_message(message), _charset='utf-8')
+
+    mail['From'] = sender
+    mail['To'] = receipient
+    mail['Subject'] = subject
+    mail['Date'] = formatdate(localtime=True)
+
+    return mail
+
+
 def send_mail(sender, receipient, subject, message):
     """Send a MIME text mail from sender to receipient with subject and message.
     The message will be wrapped to 80 characters and encoded to UTF8.
 
-    Returns False, if sending from localhost:25 fails.
+    If a spool is configured, the mail is only queued there.
+
+    Returns False, if sending from localhost:25 (or queueing) fails.
     Else returns True.
     """
-    message = wrap_message(message)
-    mail = MIMEText(message, _charset='utf-8')
+    mail = compose_mail(sender, receipient, subject, message)
 
-    mail['From'] = sender
-    mail['To'] = receipient
-    mail['Subject'] = subject
-    mail['Date'] = formatdate(localtime=True)
+    if app.config['MAIL_SPOOL_DIR']:
+        try:
+            get_outbox().enqueue(sender, receipient, mail.as_string(0))
+        except (IOError, OSError) as e:
+            logger.critical('Unable to queue mail', extra={
+                'trace': True,
+                'tags': {'spool': app.config['MAIL_SPOOL_DIR']},
+                'data': {'exception_arguments': e.args}
+            })
+            return False
+        else:
+            logger.info('Queued mail from usersuite', extra={
+                'tags': {'from': sender, 'to': receipient},
+                'data': {'subject': subject, 'message': message}
+            })
+            return True
 
     mailserver_host = app.config['MAILSERVER_HOST']
     mailserver_port = app.config['MAILSERVER_PORT']
@@ -66,3 +103,258 @@ def send_mail(sender, receipient, subject, message):
             'data': {'subject': subject, 'message': message}
         })
         return True
+
+
+class MailOutbox(object):
+    """A mail queue in a spool directory, shared by all workers.
+
+    Queued mails are written to `tmp/` and atomically renamed into
+    `new/`.  Their file names start with the time of their next delivery
+    attempt, so sorting them gives the order of delivery.  A sender
+    claims a mail by renaming it into `cur/`; if the rename fails,
+    another worker was faster.  Mails that could not be delivered are
+    put back into `new/` with an exponentially growing delay, until
+    they are moved to `failed/` after `max_attempts`.
+
+    :param spool_dir: The spool directory, created if missing
+    :param host: The SMTP server
+    :param port: The port of the SMTP server
+    :param timeout: The timeout of the SMTP connection in seconds
+    :param batch_size: The number of mails sent over one connection
+    :param retry_delay: The delay before the first retry in seconds
+    :param max_attempts: The number of delivery attempts per mail
+    """
+
+    def __init__(self, spool_dir, host, port, timeout=10, batch_size=20,
+                 retry_delay=60, max_attempts=8):
+        self.spool_dir = spool_dir
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.retry_delay = retry_delay
+        self.max_attempts = max_attempts
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self._counter = count()
+        self._lock = Lock()
+        # set when a mail is queued by this process
+        self.wakeup = Event()
+
+        for subdir in ('tmp', 'new', 'cur', 'failed'):
+            path = self._path(subdir)
+            if not os.path.isdir(path):
+                try:
+                    os.makedirs(path)
+                except OSError:
+                    # created by another worker in the meantime
+                    if not os.path.isdir(path):
+                        raise
+
+    def _path(self, subdir, filename=''):
+        return os.path.join(self.spool_dir, subdir, filename)
+
+    def _filename(self, due):
+        return '{:012d}.{}.{}.{}.json'.format(
+            int(due), socket.gethostname(), os.getpid(), next(self._counter))
+
+    def _write(self, entry, due, subdir='new'):
+        """Atomically put the entry into `new/` (or another subdirectory)"""
+        filename = self._filename(due)
+        with open(self._path('tmp', filename), 'w') as f:
+            json.dump(entry, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(self._path('tmp', filename), self._path(subdir, filename))
+
+    def enqueue(self, sender, receipient, mail_string):
+        self._write({'from': sender, 'to': receipient, 'mail': mail_string,
+                     'attempts': 0}, time.time())
+        self.wakeup.set()
+
+    def _claim(self, filename):
+        """Move a mail into `cur/` and return its entry, or None if it has
+        been claimed by another worker.
+        """
+        claimed = self._path('cur', filename)
+        try:
+            os.rename(self._path('new', filename), claimed)
+        except OSError:
+            return None
+        # the mtime tells `recover()` when the mail has been claimed
+        os.utime(claimed, None)
+        with open(claimed) as f:
+            return json.load(f)
+
+    def _due(self):
+        """Return the file names of the mails due for delivery"""
+        now = time.time()
+        return [filename for filename in sorted(os.listdir(self._path('new')))
+                if int(filename.split('.', 1)[0]) <= now]
+
+    def recover(self, max_age=3600):
+        """Put mails back into `new/` whose sender died while sending them"""
+        now = time.time()
+        for filename in os.listdir(self._path('cur')):
+            path = self._path('cur', filename)
+            try:
+                if now - os.path.getmtime(path) > max_age:
+                    os.rename(path, self._path('new', filename))
+            except OSError:
+                pass
+
+    def _retry(self, filename, entry, error):
+        """Requeue a claimed mail with a backoff or move it to `failed/`.
+
+        The claimed file is only removed after the new one has been
+        written, so a crash in between may send the mail twice, but never
+        loses it.
+        """
+        entry['attempts'] += 1
+        if entry['attempts'] >= self.max_attempts:
+            self._write(entry, time.time(), subdir='failed')
+            os.remove(self._path('cur', filename))
+            with self._lock:
+                self.failed += 1
+            logger.critical('Giving up sending mail', extra={
+                'tags': {'from': entry['from'], 'to': entry['to']},
+                'data': {'attempts': entry['attempts'], 'error': str(error)}
+            })
+            return
+
+        delay = self.retry_delay * 2 ** (entry['attempts'] - 1)
+        self._write(entry, time.time() + delay)
+        os.remove(self._path('cur', filename))
+        with self._lock:
+            self.retried += 1
+        logger.warning('Sending mail failed, retrying in %d seconds', delay,
+                       extra={
+                           'tags': {'from': entry['from'], 'to': entry['to']},
+                           'data': {'error': str(error)}
+                       })
+
+    def drain(self):
+        """Send all due mails, `batch_size` at a time over one connection.
+
+        :return: The number of mails sent
+        """
+        sent = 0
+        due = self._due()
+        while due:
+            batch, due = due[:self.batch_size], due[self.batch_size:]
+            sent_in_batch, connected = self._send_batch(batch)
+            sent += sent_in_batch
+            if not connected:
+                # the server is unreachable, try again later
+                break
+        return sent
+
+    def _send_batch(self, filenames):
+        """Send the mails over a single SMTP connection.
+
+        :return: The number of mails sent and whether the server could
+            be reached
+        """
+        smtp = None
+        sent = 0
+        try:
+            for filename in filenames:
+                entry = self._claim(filename)
+                if entry is None:
+                    continue
+                try:
+                    if smtp is None:
+                        smtp = smtplib.SMTP(timeout=self.timeout)
+                        smtp.connect(host=self.host, port=self.port)
+                    smtp.sendmail(entry['from'], entry['to'],
+                                  entry['mail'].encode('utf-8'))
+                except (IOError, smtplib.SMTPException) as e:
+                    self._retry(filename, entry, e)
+                    if isinstance(e, (IOError, smtplib.SMTPServerDisconnected,
+                                      smtplib.SMTPConnectError)):
+                        smtp = None
+                        return sent, False
+                else:
+                    os.remove(self._path('cur', filename))
+                    sent += 1
+                    with self._lock:
+                        self.sent += 1
+        finally:
+            if smtp is not None:
+                try:
+                    smtp.quit()
+                except (IOError, smtplib.SMTPException):
+                    smtp.close()
+        return sent, True
+
+    def stats(self):
+        """Return the queue depth and the counters of this process"""
+        return {
+            'queued': len(os.listdir(self._path('new'))),
+            'sending': len(os.listdir(self._path('cur'))),
+            'failed': len(os.listdir(self._path('failed'))),
+            'sent_here': self.sent,
+            'retried_here': self.retried,
+            'failed_here': self.failed,
+        }
+
+
+def outbox_from_config(config):
+    return MailOutbox(config['MAIL_SPOOL_DIR'],
+                      config['MAILSERVER_HOST'],
+                      config['MAILSERVER_PORT'],
+                      timeout=config['MAIL_TIMEOUT'],
+                      batch_size=config['MAIL_BATCH_SIZE'],
+                      retry_delay=config['MAIL_RETRY_DELAY'],
+                      max_attempts=config['MAIL_MAX_ATTEMPTS'])
+
+
+def get_outbox():
+    """Return the outbox of the current app"""
+    if 'mail_outbox' not in app.extensions:
+        app.extensions['mail_outbox'] = outbox_from_config(app.config)
+    return app.extensions['mail_outbox']
+
+
+def init_mail(app):
+    """Drain the mail spool every `MAIL_SEND_INTERVAL` seconds, if
+    `MAIL_SPOOL_DIR` is set.
+
+    Under uwsgi, a timer signal lets one worker send.  Else, a daemon
+    thread is started, which is also woken up when a mail is queued.
+    """
+    if not app.config['MAIL_SPOOL_DIR']:
+        return
+
+    outbox = app.extensions['mail_outbox'] = outbox_from_config(app.config)
+    interval = app.config['MAIL_SEND_INTERVAL']
+
+    def drain():
+        try:
+            outbox.recover()
+            outbox.drain()
+        except (IOError, OSError, ValueError) as e:
+            logger.error('Draining the mail spool failed', extra={
+                'trace': True,
+                'data': {'exception_arguments': e.args}
+            })
+
+    if os.getenv("SIPA_UWSGI", "False") == 'True':
+        import uwsgi
+
+        def drain_uwsgi(signum):
+            drain()
+
+        uwsgi.register_signal(22, "", drain_uwsgi)
+        uwsgi.add_timer(22, interval)
+    else:
+        def drain_forever():
+            while True:
+                outbox.wakeup.wait(interval)
+                outbox.wakeup.clear()
+                drain()
+
+        thread = Thread(target=drain_forever, name='mail-sender')
+        thread.daemon = True
+        thread.start()
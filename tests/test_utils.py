@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from StringIO import StringIO
+import json
+import unittest
+
+from sipa.utils import iter_json_array
+
+
+class IterJsonArrayTestCase(unittest.TestCase):
+    documents = [
+        '[]',
+        ' [ 3 , 4 ] ',
+        '[0.5, 2]',
+        '[1.5e10]',
+        '[-12.25E-3, "a,b", [1, 2.5], {"x": -0.1}, true, null]',
+        '[["85", "L\xc3\xb6btau \\"S\xc3\xbcd\\"", "3"], ["61", "Wei\xc3\x9fig", ""]]',
+    ]
+
+    def test_chunk_sizes(self):
+        for document in self.documents:
+            for chunk_size in (1, 2, 3, 512):
+                self.assertEqual(
+                    list(iter_json_array(StringIO(document), chunk_size)),
+                    json.loads(document))
+
+    def test_stops_reading(self):
+        stream = StringIO('[1, 2, 3, 4]')
+        values = iter_json_array(stream, chunk_size=1)
+        self.assertEqual(next(values), 1)
+        self.assertEqual(stream.tell(), 3)
+
+    def test_malformed(self):
+        for document in ('', '[', '[1,', '[1 2]', '[1,]', '[0.x]', '{}'):
+            for chunk_size in (1, 512):
+                with self.assertRaises(ValueError):
+                    list(iter_json_array(StringIO(document), chunk_size))